@@ -0,0 +1,6 @@
+"""
+Helpers for the commands, which are not needed to build the CLDF dataset.
+
+Since `cldfbench` registers all modules of the commands package as commands, the helpers live in
+this subpackage.
+"""
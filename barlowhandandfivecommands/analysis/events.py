@@ -0,0 +1,47 @@
+"""
+Inference of replacement events from the coding of languages and the Glottolog classification.
+"""
+
+
+def infer_replacements(values, lineages):
+    """
+    Infer replacement events from the coding of languages for replacement of ‘hand’ or ‘five’,
+    following the conservative approach: An event is assigned to a subgroup only if none of its
+    member languages is coded as not having replaced the word, and at least one as having
+    replaced it. Languages for which this is unknown do not count as exceptions.
+
+    Counts of the codes are aggregated in a single bottom-up pass over the tree, from the deepest
+    languoids up, such that the counts of each subtree are computed only once.
+
+    :param values: `dict` mapping Glottocodes of languages to the codes `yes`, `no` or `unknown`.
+    :param lineages: `dict` mapping Glottocodes of languages to ancestor Glottocodes, ordered \
+    from the family down - see `cldfbench_barlowhandandfive.austronesian_languoids`.
+    :return: Sorted `list` of Glottocodes of the topmost languoids for which the rule holds, i.e. \
+    the minimal set of subgroups (and single languages) to which events must be assigned.
+    """
+    parent, depth = {}, {}
+    for lid, lineage in lineages.items():
+        path = tuple(lineage) + (lid,)
+        for i, gc in enumerate(path):
+            depth[gc] = i
+            if i:
+                parent[gc] = path[i - 1]
+    # Languages which are not in the tree are regarded as isolates.
+    for lid in values:
+        depth.setdefault(lid, 0)
+
+    # Pairs of counts of languages coded `yes` and `no` in the subtree of each languoid:
+    counts = {gc: [0, 0] for gc in depth}
+    for lid, value in values.items():
+        if value in ('yes', 'no'):
+            counts[lid][value == 'no'] += 1
+    for gc in sorted(depth, key=lambda gc: depth[gc], reverse=True):
+        if gc in parent:
+            for i, n in enumerate(counts[gc]):
+                counts[parent[gc]][i] += n
+
+    def holds(gc):
+        yes, no = counts[gc]
+        return yes > 0 and no == 0
+
+    return sorted(gc for gc in counts if holds(gc) and not (gc in parent and holds(parent[gc])))
@@ -0,0 +1,143 @@
+"""
+Integer-coded matrix of the values in the CLDF data, for computing counts and contingency tables.
+"""
+from csvw.dsv import reader
+from clldutils.path import md5
+
+
+class CodeMatrix:
+    """
+    Dense, integer-coded matrix of the values in the CLDF data, with one row per language (in the
+    order of the LanguageTable) and one column per parameter (in the order of the ParameterTable).
+
+    A cell holds the index of the value's code in `codes[parameter]` - where the "codes" of the
+    form parameters `hand` and `five` are the sorted distinct forms - or `MISSING` if there is no
+    value for the language, or `UNCODED` if the value has no code.
+
+    Usage:
+
+    .. code-block:: python
+
+        >>> m = code_matrix(Dataset())
+        >>> m.crosstab('colex', 'num_syst', mask=m.melanesia)
+    """
+    MISSING, UNCODED = -1, -2
+
+    def __init__(self, languages, parameters, codes, matrix, melanesia):
+        """
+        :param languages: `list` of language IDs.
+        :param parameters: `list` of parameter IDs.
+        :param codes: `dict` mapping parameter IDs to lists of code IDs (or forms).
+        :param matrix: `numpy.ndarray` of shape `(len(languages), len(parameters))`.
+        :param melanesia: `numpy.ndarray` of `bool`, flagging languages in Melanesia.
+        """
+        self.languages, self.parameters, self.codes = languages, parameters, codes
+        self.matrix, self.melanesia = matrix, melanesia
+        self._languages = {lid: i for i, lid in enumerate(languages)}
+        self._parameters = {pid: i for i, pid in enumerate(parameters)}
+        self._codes = {pid: {c: i for i, c in enumerate(cs)} for pid, cs in codes.items()}
+
+    @classmethod
+    def from_cldf(cls, d):
+        """
+        :param d: `pathlib.Path` of the CLDF directory.
+        """
+        import numpy
+
+        languages, melanesia = [], []
+        for row in reader(d / 'languages.csv', dicts=True):
+            languages.append(row['ID'])
+            melanesia.append(row['Melanesia'] == 'yes')
+        parameters = [row['ID'] for row in reader(d / 'parameters.csv', dicts=True)]
+        codes = {pid: [] for pid in parameters}
+        for row in reader(d / 'codes.csv', dicts=True):
+            codes[row['Parameter_ID']].append(row['ID'])
+        forms = [
+            (row['Language_ID'], row['Parameter_ID'], row['Form'])
+            for row in reader(d / 'forms.csv', dicts=True)]
+        for pid in {pid for _, pid, _ in forms}:
+            codes[pid] = sorted({form for _, p, form in forms if p == pid})
+
+        res = cls(
+            languages,
+            parameters,
+            codes,
+            numpy.full((len(languages), len(parameters)), cls.MISSING, dtype=numpy.int32),
+            numpy.array(melanesia, dtype=bool))
+        for lid, pid, form in forms:
+            res.matrix[res._languages[lid], res._parameters[pid]] = res._codes[pid][form]
+        for row in reader(d / 'values.csv', dicts=True):
+            res.matrix[res._languages[row['Language_ID']], res._parameters[row['Parameter_ID']]] = \
+                res._codes[row['Parameter_ID']][row['Code_ID']] if row['Code_ID'] else cls.UNCODED
+        return res
+
+    def language(self, lid):
+        """
+        :return: The row index of a language.
+        """
+        return self._languages[lid]
+
+    def code(self, parameter, code):
+        """
+        :return: The integer coding a code ID (or form) of a parameter.
+        """
+        return self._codes[parameter][code]
+
+    def column(self, parameter):
+        """
+        :return: `numpy.ndarray` with the coded values of all languages for a parameter.
+        """
+        return self.matrix[:, self._parameters[parameter]]
+
+    def select(self, parameter, *codes):
+        """
+        :return: `numpy.ndarray` of `bool`, flagging languages with one of the given codes for \
+        the parameter.
+        """
+        import numpy
+
+        return numpy.isin(self.column(parameter), [self.code(parameter, c) for c in codes])
+
+    def counts(self, parameter, mask=None):
+        """
+        :param mask: Optional `numpy.ndarray` of `bool`, selecting the languages to consider.
+        :return: `numpy.ndarray` counting the languages per code of the parameter.
+        """
+        import numpy
+
+        a = self.column(parameter)
+        keep = a >= 0
+        if mask is not None:
+            keep &= mask
+        return numpy.bincount(a[keep], minlength=len(self.codes[parameter]))
+
+    def crosstab(self, parameter1, parameter2, mask=None):
+        """
+        Cross-tabulate the coded values of two parameters.
+
+        :param mask: Optional `numpy.ndarray` of `bool`, selecting the languages to consider.
+        :return: `numpy.ndarray` of shape `(len(codes[parameter1]), len(codes[parameter2]))`, \
+        counting the languages with coded values for both parameters.
+        """
+        import numpy
+
+        a, b = self.column(parameter1), self.column(parameter2)
+        keep = (a >= 0) & (b >= 0)
+        if mask is not None:
+            keep &= mask
+        n1, n2 = len(self.codes[parameter1]), len(self.codes[parameter2])
+        return numpy.bincount(a[keep] * n2 + b[keep], minlength=n1 * n2).reshape((n1, n2))
+
+
+def code_matrix(ds):
+    """
+    Read the `CodeMatrix` of the CLDF data from a snapshot cached in `.cache/`, keyed by the
+    checksums of the CSV files it is computed from.
+
+    :param ds: `cldfbench_barlowhandandfive.Dataset` instance.
+    """
+    return ds.cached(
+        'code-matrix.pickle',
+        [md5(ds.cldf_dir / fname) for fname in
+         ['languages.csv', 'parameters.csv', 'codes.csv', 'forms.csv', 'values.csv']],
+        lambda: CodeMatrix.from_cldf(ds.cldf_dir))
@@ -0,0 +1,261 @@
+"""
+Approximate search of forms by edit distance.
+"""
+import heapq
+import pathlib
+import unicodedata
+import collections
+
+from clldutils.path import md5
+
+from cldfbench_barlowhandandfive import FORM_COLUMNS
+
+
+def bit_vectors(pattern):
+    """
+    :return: `dict` mapping the characters of `pattern` to bit vectors of their positions.
+    """
+    res = {}
+    for i, c in enumerate(pattern):
+        res[c] = res.get(c, 0) | (1 << i)
+    return res
+
+
+def edit_distance(pattern, peq, text, cutoff=None):
+    """
+    Compute the edit distance between two strings with the bit-parallel algorithm of Myers (1999),
+    in the formulation of Hyyrö (2001), i.e. processing one column of the dynamic programming
+    matrix per character of `text` with a few operations on (arbitrary length) integers.
+
+    :param peq: The `bit_vectors` of `pattern`.
+    :param cutoff: If the distance exceeds `cutoff`, computation stops and `cutoff + 1` is returned.
+    """
+    m, n = len(pattern), len(text)
+    if cutoff is not None and abs(n - m) > cutoff:
+        return cutoff + 1
+    if not m:
+        return n
+    full, last = (1 << m) - 1, 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    for i, c in enumerate(text, start=1):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        # The distance can decrease by at most one per remaining character of `text`.
+        if cutoff is not None and score - (n - i) > cutoff:
+            return cutoff + 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return score
+
+
+def levenshtein(a, b, cutoff=None):
+    """
+    Compute the edit distance between two strings.
+
+    :param cutoff: If the distance exceeds `cutoff`, computation stops and `cutoff + 1` is returned.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    return edit_distance(b, bit_vectors(b), a, cutoff=cutoff)
+
+
+# Stress and length marks are disregarded when comparing forms, and "+", "=", "|" and parentheses
+# (enclosing optional parts) are regarded as morpheme boundaries, like "-".
+NORMALIZE = str.maketrans({
+    "ˈ": None, "'": None, "ˌ": None, "ː": None, ":": None,
+    "+": "-", "=": "-", "|": "-", "(": "-", ")": "-",
+})
+
+
+def normalized_form(form):
+    """
+    :return: The form in lowercase, without diacritics, normalized with `NORMALIZE` and with \
+    whitespace collapsed.
+    """
+    form = ''.join(
+        c for c in unicodedata.normalize('NFD', form.lower()) if not unicodedata.combining(c))
+    return ' '.join(form.translate(NORMALIZE).split())
+
+
+def search_form(form):
+    """
+    Morpheme boundaries are disregarded, too, when searching for similar forms.
+    """
+    return normalized_form(form).replace('-', '')
+
+
+Match = collections.namedtuple(
+    'Match', ['distance', 'form', 'glottocode', 'language_name', 'parameter', 'datasets'])
+
+
+class SimilarityIndex:
+    """
+    Index of the forms for ‘hand’ and ‘five’ supporting approximate search, i.e. retrieval of the
+    forms closest to a query in terms of edit distance of the normalized forms.
+
+    The distinct normalized forms are organized in BK-trees (Burkhard and Keller 1973) - one per
+    parameter and source dataset, so that searches restricted to a parameter or dataset can skip
+    the other trees. Each node of a BK-tree maps edit distances `d` to the subtree of forms at
+    distance `d` from the node's form. By the triangle inequality, forms within distance `r` of a
+    query at distance `d` from a node can only be found in the subtrees for distances `d - r` to
+    `d + r`.
+
+    Usage:
+
+    .. code-block:: python
+
+        >>> index = similarity_index(Dataset())
+        >>> index.query('lima', k=5, parameter='hand')
+    """
+    # Queries restricted to languages with less than this share of the distinct forms are answered
+    # by comparing the query with all their forms, rather than by searching the BK-trees.
+    SCAN_THRESHOLD = 0.1
+
+    def __init__(self, rows):
+        """
+        :param rows: Rows of `raw/Forms_of_hand_and_five_in_Austronesian_languages.tsv`, with \
+        (at least) the `FORM_COLUMNS` as attributes.
+        """
+        # Forms are aggregated per language-level Glottocode and parameter across datasets:
+        entries = {}
+        for row in rows:
+            gc = row.Language_level_glottocode or row.Glottocode
+            if not (gc and row.Form):
+                continue
+            key = (gc, row.Parameter_ID, row.Form)
+            if key not in entries:
+                entries[key] = (row.Language_name, [])
+            if row.Dataset not in entries[key][1]:
+                entries[key][1].append(row.Dataset)
+
+        self._entries = collections.defaultdict(list)
+        self._forms_by_glottocode = collections.defaultdict(set)
+        self._trees = {}
+        for (gc, pid, form), (name, datasets) in entries.items():
+            nform = search_form(form)
+            self._entries[nform].append((form, gc, name, pid, tuple(datasets)))
+            self._forms_by_glottocode[gc].add(nform)
+            for ds in datasets:
+                self._add((pid, ds), nform)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _add(self, key, form):
+        if key not in self._trees:
+            self._trees[key] = (form, {})
+            return
+        node = self._trees[key]
+        while node[0] != form:
+            d = levenshtein(form, node[0])
+            if d not in node[1]:
+                node[1][d] = (form, {})
+                return
+            node = node[1][d]
+
+    def _search(self, query, trees, radius):
+        """
+        Search BK-trees best-first, i.e. visiting subtrees in order of the lower bound for the
+        distance of their forms to the query.
+
+        :param radius: Callable returning the current search radius.
+        :return: generator of pairs `(distance, normalized form)`.
+        """
+        # Forms may appear in multiple trees, so we memoize exact distances and report each form
+        # only once.
+        peq, distances, seen = bit_vectors(query), {}, set()
+        queue = [(0, i, tree) for i, tree in enumerate(trees)]
+        n = len(queue)
+        while queue:
+            bound, _, (form, children) = heapq.heappop(queue)
+            r = radius()
+            if bound > r:
+                continue
+            if form in distances:
+                d = distances[form]
+            else:
+                # We need the exact distance only if the form is within the radius or if the
+                # distance determines which subtrees to visit.
+                cutoff = None if r == float('inf') else r + max(children, default=0)
+                d = edit_distance(query, peq, form, cutoff=cutoff)
+                if cutoff is None or d <= cutoff:
+                    distances[form] = d
+            if form not in seen:
+                seen.add(form)
+                yield d, form
+            for dd, child in children.items():
+                if abs(d - dd) <= r:
+                    n += 1
+                    heapq.heappush(queue, (abs(d - dd), n, child))
+
+    def query(self, form, k=10, parameter=None, datasets=None, glottocodes=None, max_distance=None):
+        """
+        Retrieve the forms closest to a query form.
+
+        :param form: The query form.
+        :param k: Maximal number of matches to return.
+        :param parameter: Only consider forms for this parameter.
+        :param datasets: Only consider forms attested in one of these datasets.
+        :param glottocodes: Only consider forms of languages with these (language-level) Glottocodes.
+        :param max_distance: Only consider forms within this edit distance of the query.
+        :return: `list` of the (at most) `k` closest `Match`es, ordered by distance, with ties \
+        ordered by form, Glottocode and parameter.
+        """
+        query = search_form(form)
+        radius = float('inf') if max_distance is None else max_distance
+        # Max-heap (of negated values) of the distances of the `k` best matches found so far:
+        best, matches = [], []
+
+        if glottocodes is not None:
+            glottocodes = set(glottocodes)
+            forms = set().union(*(self._forms_by_glottocode.get(gc, ()) for gc in glottocodes))
+        if glottocodes is not None and len(forms) < self.SCAN_THRESHOLD * len(self):
+            peq = bit_vectors(query)
+            candidates = ((edit_distance(query, peq, f), f) for f in sorted(forms))
+        else:
+            candidates = self._search(
+                query,
+                [tree for (pid, ds), tree in sorted(self._trees.items())
+                 if (not parameter or pid == parameter) and (not datasets or ds in datasets)],
+                lambda: radius)
+
+        for d, nform in candidates:
+            if d > radius:
+                continue
+            for f, gc, name, pid, ds in self._entries[nform]:
+                if (parameter and pid != parameter) or \
+                        (glottocodes is not None and gc not in glottocodes) or \
+                        (datasets and not set(ds).intersection(datasets)):
+                    continue
+                matches.append(Match(d, f, gc, name, pid, ds))
+                heapq.heappush(best, -d)
+                if len(best) > k:
+                    heapq.heappop(best)
+                if len(best) == k:
+                    radius = min(radius, -best[0])
+        return sorted(
+            (m for m in matches if m.distance <= radius),
+            key=lambda m: (m.distance, m.form, m.glottocode, m.parameter))[:k]
+
+
+def similarity_index(ds):
+    """
+    Read the `SimilarityIndex` from a snapshot cached in `.cache/`, keyed by the checksums of the
+    forms TSV and of this module - which defines the normalization of the indexed forms.
+
+    :param ds: `cldfbench_barlowhandandfive.Dataset` instance.
+    """
+    fname = 'Forms_of_hand_and_five_in_Austronesian_languages'
+    return ds.cached(
+        'similarity-index.pickle',
+        [md5(ds.raw_dir / '{}.tsv'.format(fname)), md5(pathlib.Path(__file__))],
+        lambda: SimilarityIndex(ds.iterrows(fname, columns=FORM_COLUMNS)))
@@ -0,0 +1,84 @@
+"""
+The parsed rows of the CLDF data, cached for the commands reading it.
+"""
+import collections
+
+from clldutils.path import md5
+
+
+class CLDFSnapshot:
+    """
+    The rows of the tables of the CLDF data - as read by `pycldf` - indexed by ID and, for tables
+    with a parameter reference, grouped by parameter.
+
+    Usage:
+
+    .. code-block:: python
+
+        >>> cldf = cldf_snapshot(Dataset())
+        >>> cldf.get_row('ParameterTable', 'colex')['Name']
+        >>> cldf.by_parameter('ValueTable')['colex']
+    """
+    def __init__(self, tables, parameter_columns):
+        """
+        :param tables: `dict` mapping table names - i.e. component names for CLDF components, \
+        otherwise the URL of the table - to lists of rows.
+        :param parameter_columns: `dict` mapping table names to the name of the parameter \
+        reference column.
+        """
+        self.tables = tables
+        self._rows = {name: {row['ID']: row for row in rows} for name, rows in tables.items()}
+        self._by_parameter = {}
+        for name, col in parameter_columns.items():
+            grouped = collections.defaultdict(list)
+            for row in tables[name]:
+                grouped[row[col]].append(row)
+            self._by_parameter[name] = dict(grouped)
+
+    @classmethod
+    def from_cldf(cls, cldf):
+        """
+        :param cldf: `pycldf.Dataset`.
+        """
+        tables, parameter_columns = {}, {}
+        for table in cldf.tables:
+            name = table.common_props.get('dc:conformsTo', '').partition('#')[2] or table.url.string
+            tables[name] = [dict(row) for row in cldf.iter_rows(name)]
+            try:
+                parameter_columns[name] = cldf[name, 'parameterReference'].name
+            except KeyError:
+                pass
+        return cls(tables, parameter_columns)
+
+    def iter_rows(self, table):
+        """
+        :return: `list` of the rows of a table, in the order of the CSV file.
+        """
+        return self.tables[table]
+
+    def get_row(self, table, id_):
+        """
+        :return: The row of `table` with ID `id_`.
+        """
+        return self._rows[table][id_]
+
+    def by_parameter(self, table):
+        """
+        :return: `dict` mapping parameter IDs to the rows of `table` referencing the parameter - \
+        in the order of the CSV file.
+        """
+        return self._by_parameter[table]
+
+
+def cldf_snapshot(ds):
+    """
+    Read the `CLDFSnapshot` of the CLDF data from a snapshot cached in `.cache/`, keyed by the
+    checksums of the metadata and the CSV files of the CLDF dataset. Thus, the CLDF data is
+    parsed only once after each run of `makecldf`.
+
+    :param ds: `cldfbench_barlowhandandfive.Dataset` instance.
+    """
+    return ds.cached(
+        'cldf.pickle',
+        [md5(p) for p in sorted(ds.cldf_dir.iterdir()) if p.suffix in {'.json', '.csv'}],
+        lambda: CLDFSnapshot.from_cldf(ds.cldf_reader()))
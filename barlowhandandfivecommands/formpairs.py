@@ -0,0 +1,191 @@
+"""
+Audit the selection of forms for ‘hand’ and ‘five’: For each language, determine the pair of
+attested forms closest to exhibiting full colexification (or, failing that, partial
+colexification) and report where it is more closely related than the curated choice.
+
+Pairs are ranked by the relation of the forms - identical, identical up to bound morphemes,
+sharing a word or a substring of three characters, or none - and then by normalized edit distance.
+Alternative forms given in one form - separated by "/" or "," - are compared separately.
+"""
+import re
+import time
+import functools
+import itertools
+import collections
+
+from clldutils.clilib import Table, add_format
+
+from cldfbench_barlowhandandfive import Dataset
+from barlowhandandfivecommands.analysis.similarity import levenshtein, normalized_form
+
+Pair = collections.namedtuple('Pair', ['hand', 'five', 'relation', 'distance'])
+RANKS = {'identical': 3, 'affixed': 2, 'partial': 1, 'none': 0}
+# Maximal length of segments of a word (separated by hyphens), which are regarded as bound
+# morphemes, e.g. possessive suffixes as in "lima-na".
+AFFIX_LENGTH = 3
+# Minimal length of substrings shared by words exhibiting partial colexification, e.g. "lim" in
+# "na-limu-ku" and "katilim".
+SHARED_LENGTH = 3
+
+
+def register(parser):
+    add_format(parser, default='pipe')
+    parser.add_argument(
+        '--all',
+        help="List all languages, not only those for which the curated pair differs.",
+        action='store_true',
+        default=False,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def alternates(form):
+    """
+    :return: `tuple` of the normalized alternative forms given in a form. Single characters \
+    separated by "/" - as in "uma/n" - are not regarded as alternatives.
+    """
+    parts = tuple(f for f in (normalized_form(f) for f in re.split(r'[/,]', form)) if f)
+    return parts if parts and all(len(f) > 1 for f in parts) else (normalized_form(form),)
+
+
+def segments(form):
+    return [s for s in re.split(r'[-\s]+', form) if s]
+
+
+def shares_substring(a, b, n=SHARED_LENGTH):
+    """
+    :return: Whether a word of `a` and a word of `b` share a substring of length `n` - \
+    disregarding morpheme boundaries.
+    """
+    a, b = [w.replace('-', '') for w in a.split()], [w.replace('-', '') for w in b.split()]
+    return any(w[i:i + n] in v for w in a for v in b for i in range(len(w) - n + 1))
+
+
+def _relation(hand, five):
+    if hand == five:
+        return 'identical'
+    hs, fs = segments(hand), segments(five)
+    if not re.search(r'\s', hand + five):
+        for stem in set(hs).intersection(fs):
+            if all(len(s) <= AFFIX_LENGTH for s in hs + fs if s != stem):
+                return 'affixed'
+    if hand in five or five in hand or set(hs).intersection(fs) or shares_substring(hand, five):
+        return 'partial'
+    return 'none'
+
+
+def relation(hand, five):
+    """
+    :return: The closest relation between alternatives of two (normalized) forms:
+        - `identical`,
+        - `affixed`, i.e. single words which share a segment and differ only in bound morphemes,
+        - `partial`, i.e. one form is contained in the other, or the forms share a segment or a \
+          substring of `SHARED_LENGTH` characters within a word, or
+        - `none`.
+    """
+    return max(
+        (_relation(h, f) for h, f in itertools.product(alternates(hand), alternates(five))),
+        key=lambda rel: RANKS[rel])
+
+
+def _distance(hand, five, cutoff=None):
+    n = max(len(hand), len(five), 1)
+    # The normalized difference in length is a lower bound for the normalized distance.
+    bound = abs(len(hand) - len(five)) / n
+    if cutoff is not None and bound > cutoff:
+        return bound
+    return levenshtein(hand, five, cutoff=None if cutoff is None else int(cutoff * n)) / n
+
+
+def distance(hand, five, cutoff=None):
+    """
+    Compute the normalized edit distance between (the closest alternatives of) two forms.
+
+    :param cutoff: Normalized distance beyond which we are not interested in the exact distance. \
+    For more distant forms a value greater than `cutoff` is returned.
+    """
+    return min(
+        _distance(h, f, cutoff=cutoff)
+        for h, f in itertools.product(alternates(hand), alternates(five)))
+
+
+def compare(hand, five):
+    return Pair(hand, five, relation(hand, five), distance(hand, five))
+
+
+def score(pair):
+    return RANKS[pair.relation], -pair.distance
+
+
+def best_pair(hands, fives):
+    """
+    Determine the pair of forms closest to exhibiting colexification. Of equally good pairs, the
+    first in order of the candidate lists is chosen.
+
+    Identical forms are looked up via set intersection. Otherwise, pairs are compared in order,
+    skipping pairs with a lower ranked relation than the best pair so far, and computing edit
+    distances of pairs with equally ranked relation only up to the distance of the best pair.
+
+    :param hands: `list` of candidate forms for ‘hand’.
+    :param fives: `list` of candidate forms for ‘five’.
+    :return: `Pair` or `None`, if there are no candidates for one of the concepts.
+    """
+    common = set(hands).intersection(fives)
+    if common:
+        form = [h for h in hands if h in common][0]
+        return Pair(form, form, 'identical', 0.0)
+    best = None
+    for hand, five in itertools.product(hands, fives):
+        rel = relation(hand, five)
+        if best and RANKS[rel] < RANKS[best.relation]:
+            continue
+        cutoff = best.distance if best and RANKS[rel] == RANKS[best.relation] else None
+        pair = Pair(hand, five, rel, distance(hand, five, cutoff=cutoff))
+        if best is None or score(pair) > score(best):
+            best = pair
+    return best
+
+
+def audit(colex, forms):
+    """
+    :param colex: Rows of the colexification TSV.
+    :param forms: `FormIndex`.
+    :return: generator of triples `(row, curated Pair or None, best Pair or None)`.
+    """
+    for row in colex:
+        gc = row['Glottocode']
+        best = best_pair(forms.forms(gc, 'hand'), forms.forms(gc, 'five'))
+        curated = compare(row['hand'], row['five']) \
+            if row['hand'] not in {'', '_'} and row['five'] not in {'', '_'} else None
+        yield row, curated, best
+
+
+def run(args):
+    ds = Dataset()
+    start = time.perf_counter()
+    colex = list(ds.iterrows('Colexification_of_hand_and_five_in_Austronesian_languages'))
+    forms = ds.form_index()
+    results = list(audit(colex, forms))
+    args.log.info('Audited {} languages in {:.2f}s'.format(
+        len(results), time.perf_counter() - start))
+
+    count = 0
+    with Table(
+            args,
+            'Glottocode', 'Language', 'Curated pair', 'Relation', 'Coded as', 'Best pair', 'Relation',
+    ) as t:
+        for row, curated, best in results:
+            # Only pairs more closely related than the curated pair are reported:
+            differs = best and (not curated or RANKS[best.relation] > RANKS[curated.relation])
+            count += bool(differs)
+            if differs or args.all:
+                t.append([
+                    row['Glottocode'],
+                    row['Language_name'],
+                    '{} / {}'.format(curated.hand, curated.five) if curated else '',
+                    curated.relation if curated else '',
+                    row['Is_there_colexification?'],
+                    '{} / {}'.format(best.hand, best.five) if best else '',
+                    best.relation if best else '',
+                ])
+    args.log.info('{} languages with differences between curated and best pair'.format(count))
@@ -1,64 +1,355 @@
 """
 Plot parameter maps for the paper.
 """
+import os
+import re
 import json
-import itertools
+import logging
+import argparse
 import subprocess
 
-from cldfbench_barlowhandandfive import Dataset
+from pycldf import Dataset as CLDFDataset
+from clldutils import jsonlib
 
+from cldfbench_barlowhandandfive import Dataset, Profile, checksum
+from barlowhandandfivecommands.analysis.snapshot import cldf_snapshot
+from barlowhandandfivecommands.analysis.matrix import code_matrix
 
-def plot(format, pid, colors, mdpath, mapdir):
-    o = mapdir / '{}.{}'.format(pid, format)
+# CLDF datasets loaded for in-process rendering, keyed by metadata path.
+_DATASETS = {}
+SVG_OPTIONS = [
+    '--format', 'svg',
+    '--padding-top', '5',
+    '--padding-bottom', '5',
+    '--projection', 'Mollweide',
+    '--width', '10',
+    '--markersize', '4',
+    '--with-ocean',
+    '--no-legend',
+]
+
+
+def register(parser):
+    parser.add_argument(
+        '--workers',
+        help="Number of maps to render in parallel.",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        '--subprocess',
+        help="Render each map by calling `cldfbench cldfviz.map` in a subprocess, rather than "
+             "rendering all maps within this process.",
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--svg-precision',
+        help="Number of decimals to keep for coordinates in SVG maps.",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        '--profile',
+        help="Record wall time, CPU time and memory use of the stages of rendering the maps in "
+             "maps.profile.json (can also be enabled by setting the environment variable "
+             "BARLOWHANDANDFIVE_PROFILE).",
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--force',
+        help="Re-render all maps, even those recorded as up-to-date in maps/.manifest.json.",
+        action='store_true',
+        default=False,
+    )
+
+
+def plot_in_process(mdpath, cmd):
+    """
+    Render a map with the `cldfviz.map` machinery, re-using the CLDF dataset loaded for `mdpath`.
+
+    :param cmd: Options for `cldfbench cldfviz.map`.
+    """
+    from cldfviz.commands import map as cldfviz_map
+    from cldfviz.cli_util import get_multiparameter
+    from cldfviz.glottolog import Glottolog
+
+    if mdpath not in _DATASETS:
+        _DATASETS[mdpath] = CLDFDataset.from_metadata(mdpath)
+    parser = argparse.ArgumentParser()
+    cldfviz_map.register(parser)
+    args = parser.parse_args(cmd + [str(mdpath)])
+    args.log = logging.getLogger(__name__)
+
+    data, cms = get_multiparameter(
+        args, _DATASETS[mdpath], Glottolog.from_args(args), exclude_lang=lambda lg: lg.lat is None)
+    with cldfviz_map.FORMATS[args.format](data.languages.values(), args) as fig:
+        for lang, values in data.iter_languages():
+            fig.api_add_language(lang, values, cms)
+        if not args.no_legend:
+            fig.api_add_legend(data.parameters, cms)
+
+
+def map_options(format, pid, colors, with_melanesia=False):
+    """
+    :return: `list` of options for `cldfbench cldfviz.map` to render the map for a parameter - \
+    except for the output path.
+    """
     cmd = [
-        'cldfbench',
-        'cldfviz.map',
         '--parameter', pid,
         '--colormaps',
         json.dumps(colors),
         '--pacific-centered',
         '--no-open',
     ]
+    if with_melanesia:
+        cmd.extend([
+            '--language-properties', 'Melanesia',
+            '--language-properties-colormaps', '{"yes":"circle","no":"triangle_up"}',
+        ])
     if format == 'html':
         cmd.extend(['--with-layers', '--value-template', '__{code}__'])
     else:  # format == 'svg'
-        cmd.extend([
-            '--format', 'svg',
-            '--padding-top', '5',
-            '--padding-bottom', '5',
-            '--projection', 'Mollweide',
-            '--width', '10',
-            '--markersize', '4',
-            '--with-ocean',
-            '--no-legend',
-        ])
-    cmd.extend(['--output', str(o), str(mdpath)])
-    subprocess.check_call(cmd)
+        cmd.extend(SVG_OPTIONS)
+    return cmd
+
+
+def plot(format, pid, colors, mdpath, mapdir, with_melanesia=False, in_process=True):
+    o = mapdir / '{}.{}'.format(pid, format)
+    cmd = map_options(format, pid, colors, with_melanesia) + ['--output', str(o)]
+    if in_process:
+        plot_in_process(mdpath, cmd)
+    else:
+        subprocess.check_call(['cldfbench', 'cldfviz.map'] + cmd + [str(mdpath)])
     assert o.exists()
     return o
 
 
+def render(jobs, workers=1, log=None, profile=None):
+    """
+    Render maps, possibly in parallel.
+
+    :param jobs: `list` of argument tuples for `plot`.
+    :param profile: `Profile` recording each render - or all renders, when run in parallel.
+    :return: `list` of paths of the rendered maps, in the order of `jobs`.
+    """
+    profile = profile or Profile(enabled=False)
+    if workers <= 1:
+        res = []
+        for job in jobs:
+            with profile.stage('render {}.{}'.format(job[1], job[0])):
+                res.append(plot(*job))
+        return res
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    res, errors = [], []
+    with profile.stage('render') as stage, ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(plot, *job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                res.append(future.result())
+            except Exception as e:
+                errors.append('{}.{}'.format(job[1], job[0]))
+                if log:
+                    log.error('Rendering {}.{} failed: {}'.format(job[1], job[0], e))
+        stage['maps'] = len(res)
+    if errors:
+        raise ValueError('Rendering failed for maps: {}'.format(', '.join(errors)))
+    return res
+
+
+def substitute(p, replacements, chunk_size=1024 * 1024):
+    """
+    Replace all occurrences of the keys of `replacements` in a text file in a single pass.
+
+    The file is read in chunks of `chunk_size` characters; the result is written to a temporary
+    file, which then replaces the original.
+    """
+    # Longer keys take precedence over keys which are prefixes of them.
+    pattern = re.compile('|'.join(
+        re.escape(k) for k in sorted(replacements, key=lambda k: -len(k))))
+    # A match may start at most this many characters before the end of the data read so far:
+    overlap = max(len(k) for k in replacements) - 1
+    tmp = p.parent / '.{}.tmp'.format(p.name)
+    with p.open(encoding='utf8') as fin, tmp.open('w', encoding='utf8') as fout:
+        buffer = ''
+        while True:
+            chunk = fin.read(chunk_size)
+            buffer += chunk
+            # Matches starting at or after `cut` may extend into the next chunk.
+            cut = len(buffer) - overlap if chunk else len(buffer)
+            pos = 0
+            for m in pattern.finditer(buffer):
+                if m.start() >= cut:
+                    break
+                fout.write(buffer[pos:m.start()])
+                fout.write(replacements[m.group()])
+                pos = m.end()
+            if pos < cut:
+                fout.write(buffer[pos:cut])
+                pos = cut
+            buffer = buffer[pos:]
+            if not chunk:
+                break
+    os.replace(tmp, p)
+
+
+def compact_svg(p, precision=2):
+    """
+    Reduce the size of an SVG map as written by matplotlib.
+
+    - Coordinates are rounded to `precision` decimals and path data is written without redundant
+      commands.
+    - Identical marker definitions are merged into one definition, referenced by all markers.
+    - Paths consisting of a single point - which are not displayed - are removed.
+    - Consecutive marker groups sharing the same clip path are merged.
+
+    :return: pair of file sizes before and after compaction.
+    """
+    def number(s):
+        res = '{:.{}f}'.format(float(s), precision)
+        if '.' in res:
+            res = res.rstrip('0').rstrip('.')
+        return '0' if res == '-0' else res
+
+    def path_data(d):
+        res, command = [], None
+        for token in d.split():
+            if token.isalpha():
+                # "L" is implied for coordinates following "M" or "L".
+                if token == 'L' and command in {'M', 'L'}:
+                    continue
+                command = token
+                res.append(token)
+            else:
+                res.append(number(token))
+        return ' '.join(res)
+
+    def merge_groups(m):
+        # Only merge if the group to be closed has the same clip path:
+        prev = m.string.rfind('<g clip-path=', 0, m.start())
+        if m.string.startswith('<g clip-path="url(#{})"'.format(m.group(2)), prev):
+            return m.group(1)
+        return m.group()
+
+    size = p.stat().st_size
+    svg = p.read_text(encoding='utf8')
+
+    # Collect marker definitions, ...
+    markers, ids = {}, {}
+    for m in re.finditer(r'<path id="(m[0-9a-f]+)" d="([^"]*)"( style="[^"]*")?/>', svg):
+        ids[m.group(1)] = markers.setdefault(m.group(2, 3), m.group(1))
+    svg = re.sub(r'\s*<path id="m[0-9a-f]+" d="[^"]*"( style="[^"]*")?/>', '', svg)
+    svg = re.sub(r'\s*<defs>\s*</defs>', '', svg)
+    # ... and add the distinct ones to the top-level definitions.
+    if markers:
+        svg = svg.replace('</style>\n', '</style>\n{}\n'.format('\n'.join(
+            '  <path id="{}" d="{}"{}/>'.format(mid, d, style or '')
+            for (d, style), mid in markers.items())), 1)
+    svg = re.sub(
+        r'xlink:href="#(m[0-9a-f]+)"', lambda m: 'xlink:href="#{}"'.format(ids[m.group(1)]), svg)
+
+    svg = re.sub(r'\s*<path d="M\s+[-0-9.]+\s+[-0-9.]+\s*"[^>]*/>', '', svg)
+    svg = re.sub(
+        r'(<use [^>]*/>)\s*</g>\s*</g>\s*<g id="(?:PathCollection|line2d)_[0-9]+">\s*'
+        r'<g clip-path="url\(#(\w+)\)">(?=\s*<use)',
+        merge_groups,
+        svg)
+    svg = re.sub(r' d="([^"]*)"', lambda m: ' d="{}"'.format(path_data(m.group(1))), svg)
+    svg = re.sub(
+        r' (x|y)="([^"]*)"', lambda m: ' {}="{}"'.format(m.group(1), number(m.group(2))), svg)
+    p.write_text(svg, encoding='utf8')
+    return size, p.stat().st_size
+
+
 def run(args):
-    cldf = Dataset().cldf_reader()
-    mapdir = cldf.directory.parent / 'maps'
-    pids = [r['ID'] for r in cldf.iter_rows('ParameterTable')]
+    profile = Profile(enabled=args.profile or None)
+    ds = Dataset()
+    with profile.stage('load'):
+        # The CLDF dataset itself is only loaded when maps are rendered in-process.
+        cldf = cldf_snapshot(ds)
+    mapdir = ds.dir / 'maps'
+    mdpath = ds.cldf_dir / ds.cldf_specs().metadata_fname
+    codes = cldf.by_parameter('CodeTable')
     parameters = {
-        pid: list(rows) for pid, rows in itertools.groupby(
-            sorted(cldf.iter_rows('CodeTable'), key=lambda r: r['Parameter_ID']),
-            lambda r: r['Parameter_ID'])}
+        r['ID']: codes[r['ID']] for r in cldf.iter_rows('ParameterTable') if r['ID'] in codes}
+    matrix = code_matrix(ds)
     value_count = {
-        cid: len(list(rows)) for cid, rows in itertools.groupby(
-            sorted(cldf.iter_rows('ValueTable'), key=lambda r: r['Code_ID'] or 'xxxx'),
-            lambda r: r['Code_ID'])}
+        cid: int(n) for pid in parameters
+        for cid, n in zip(matrix.codes[pid], matrix.counts(pid))}
+
+    # A map needs to be re-rendered if the data it depicts or the rendering options changed, which
+    # we detect by comparing checksums with the ones recorded in the manifest.
+    manifest_path = mapdir / '.manifest.json'
+    manifest = jsonlib.load(manifest_path) if manifest_path.exists() else {}
+    languages = [
+        (r['ID'], r['Latitude'], r['Longitude'], r['Melanesia'])
+        for r in cldf.iter_rows('LanguageTable')]
+    values = {
+        pid: sorted(rows, key=lambda r: r['ID'])
+        for pid, rows in cldf.by_parameter('ValueTable').items()}
+
+    from cldfviz import __version__ as cldfviz_version
+
+    jobs, checksums = [], {}
+    for pid, codes in parameters.items():
+        for format in ['svg', 'html']:
+            job = (
+                format,
+                pid,
+                {c['ID']: c['color'] for c in codes},
+                mdpath,
+                mapdir,
+                pid == 'num_syst',
+                not args.subprocess)
+            name = '{}.{}'.format(pid, format)
+            checksums[name] = checksum(
+                map_options(*job[:3], with_melanesia=job[5]),
+                cldfviz_version,
+                args.svg_precision if format == 'svg' else None,
+                codes,
+                values[pid],
+                languages)
+            if args.force or manifest.get(name) != checksums[name] \
+                    or not mapdir.joinpath(name).exists():
+                jobs.append(job)
+            else:
+                args.log.info('Skipping up-to-date map {}'.format(name))
+    maps = dict(zip(
+        [(job[1], job[0]) for job in jobs], render(jobs, args.workers, args.log, profile)))
+
+    for (pid, format), p in maps.items():
+        if format == 'svg':
+            with profile.stage('compact {}'.format(p.name)):
+                size, compacted = compact_svg(p, precision=args.svg_precision)
+            args.log.info('{}: {:,} -> {:,} bytes ({:.0%} smaller)'.format(
+                p.name, size, compacted, 1 - compacted / size))
+
+    for pid, codes in parameters.items():
+        if (pid, 'html') not in maps:
+            continue
+        replacements = {'__' + c['ID'] + '__': c['Name'] for c in codes}
+        if pid == 'num_syst':
+            # Melanesia markers are labeled with the language property, which we want to drop from
+            # tooltips.
+            for v in ['yes', 'no']:
+                replacements.update({
+                    '__{}__'.format(v): v,
+                    ' / __{}__"'.format(v): '"',
+                    ' / {}"'.format(v): '"',
+                })
+        with profile.stage('substitute {}'.format(maps[pid, 'html'].name)):
+            substitute(maps[pid, 'html'], replacements)
+
     readme = ["""\
 # Maps
 
 The maps below have been created using the `cldfviz.map` command from the [`cldfviz` package](https://pypi.org/project/cldfviz/).
 
 """]
-    for pid, codes in sorted(parameters.items(), key=lambda t: pids.index(t[0])):
-        if pid == 'num_syst':
-            continue
+    for pid, codes in parameters.items():
         readme.append('## {}\n'.format(
             cldf.get_row('ParameterTable', pid)['Name'].replace('_', ' ')))
         readme.append(cldf.get_row('ParameterTable', pid)['Description'] or '')
@@ -69,86 +360,19 @@ The maps below have been created using the `cldfviz.map` command from the [`cldf
                 c['color'], c['Name'], value_count[c['ID']], c['Description']))
         readme.append('&nbsp; | &nbsp; | **{}** | &nbsp;'.format(sum(value_count[c['ID']] for c in codes)))
 
-        plotargs = (
-            pid, {c['ID']: c['color'] for c in codes}, cldf.directory / cldf.filename, mapdir)
-        p = plot('svg', *plotargs)
-        readme.append('\n![{}]({})\n'.format(pid, p.name))
-        p = plot('html', *plotargs)
-        html = p.read_text(encoding='utf8')
-        for c in codes:
-            html = html.replace('__' + c['ID'] + '__', c['Name'])
-        p.write_text(html, encoding='utf8')
+        if pid == 'num_syst':
+            readme.append('\n&nbsp; | Value | Count | Description')
+            readme.append('---:| --- | ---:| ---')
+            readme.append('⏺| in Melanesia | {} | '.format(int(matrix.melanesia.sum())))
+            readme.append('▼| not in Melanesia | {} | '.format(int((~matrix.melanesia).sum())))
+
+        readme.append('\n![{}]({}.svg)\n'.format(pid, pid))
         readme.append(
             'View [interactive map](https://cldf-datasets.github.io/barlowhandandfive/maps/'
             '{}.html).\n'.format(pid))
-    #
-    # Now add a "numeral systems" map
-    #
-    o = mapdir / 'num_syst.svg'
-    cmd = [
-        'cldfbench',
-        'cldfviz.map',
-        '--parameter', 'num_syst',
-        '--language-properties', 'Melanesia',
-        '--colormaps',
-        json.dumps({c['ID']: c['color'] for c in parameters['num_syst']}),
-        '--language-properties-colormaps', '{"yes":"circle","no":"triangle_up"}',
-        '--pacific-centered',
-        '--no-open',
-        '--format', 'svg',
-        '--padding-top', '5',
-        '--padding-bottom', '5',
-        '--projection', 'Mollweide',
-        '--width', '10',
-        '--markersize', '4',
-        '--with-ocean',
-        '--no-legend',
-        '--output', str(o),
-        str(cldf.directory / cldf.filename)]
-    subprocess.check_call(cmd)
-    assert o.exists()
-
-    readme.append('## {}\n'.format(
-        cldf.get_row('ParameterTable', pid)['Name'].replace('_', ' ')))
-    readme.append(cldf.get_row('ParameterTable', pid)['Description'])
-    readme.append('\n&nbsp; | Value | Count | Description')
-    readme.append('--- | --- | ---:| ---')
-    for c in codes:
-        readme.append('$${{\color{{{}}}⏺}}$$ | {} | {} | {}'.format(
-            c['color'], c['Name'], value_count[c['ID']], c['Description']))
-    readme.append('&nbsp; | &nbsp; | **{}** | &nbsp;'.format(sum(value_count[c['ID']] for c in codes)))
-
-    readme.append('\n&nbsp; | Value | Count | Description')
-    readme.append('---:| --- | ---:| ---')
-    readme.append('⏺| in Melanesia | {} | '.format(sum(1 for l in cldf['LanguageTable'] if l['Melanesia'] == 'yes')))
-    readme.append('▼| not in Melanesia | {} | '.format(sum(1 for l in cldf['LanguageTable'] if l['Melanesia'] == 'no')))
-
-    readme.append('\n![num_syst](num_syst.svg)\n')
-
-    o = mapdir / 'num_syst.html'
-    cmd = [
-        'cldfbench',
-        'cldfviz.map',
-        '--parameter', 'num_syst',
-        '--language-properties', 'Melanesia',
-        '--colormaps',
-        json.dumps({c['ID']: c['color'] for c in parameters['num_syst']}),
-        '--language-properties-colormaps', '{"yes":"circle","no":"triangle_up"}',
-        '--pacific-centered',
-        '--no-open',
-        '--with-layers',
-        '--value-template', '__{code}__',
-        '--output', str(o),
-        str(cldf.directory / cldf.filename)]
-    subprocess.check_call(cmd)
-    assert o.exists()
-
-    html = o.read_text(encoding='utf8').replace('__no__', 'no').replace('__yes__', 'yes')
-    for c in parameters['num_syst']:
-        html = html.replace('__' + c['ID'] + '__', c['Name'])
-    html = html.replace(' / yes"', '"').replace(' / no"', '"')
-    o.write_text(html, encoding='utf8')
-    readme.append(
-        'View [interactive map](https://cldf-datasets.github.io/barlowhandandfive/maps/'
-        'num_syst.html).\n')
     mapdir.joinpath('README.md').write_text('\n'.join(readme))
+    for pid, format in maps:
+        name = '{}.{}'.format(pid, format)
+        manifest[name] = checksums[name]
+    jsonlib.dump(manifest, manifest_path, indent=2)
+    profile.write(ds.dir / 'maps.profile.json')
@@ -0,0 +1,120 @@
+"""
+Export the tables of the CLDF dataset to Parquet (or Arrow IPC) files, e.g. for analysis with
+pandas or DuckDB.
+
+Column types are derived from the table schemas in the CLDF metadata:
+- list-valued columns (i.e. columns with a separator, like `Source` or `Language_IDs`) are exported
+  as lists,
+- string columns - except for the primary key - are dictionary-encoded,
+- decimals are exported as double precision floats and JSON values as their serialization.
+
+Requires `pyarrow`, i.e. installation with `pip install -e .[parquet]`.
+"""
+import os
+import json
+import pathlib
+
+from clldutils import jsonlib
+
+from cldfbench_barlowhandandfive import Dataset
+from barlowhandandfivecommands.analysis.snapshot import cldf_snapshot
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def register(parser):
+    parser.add_argument(
+        '--format',
+        choices=list(FORMATS),
+        default='parquet',
+    )
+    parser.add_argument(
+        '--output',
+        help="Directory to write the files to (default: parquet/ in the dataset directory).",
+        type=pathlib.Path,
+        default=None,
+    )
+
+
+def base_type(column):
+    datatype = column.get('datatype') or 'string'
+    return datatype['base'] if isinstance(datatype, dict) else datatype
+
+
+def arrow_schema(table):
+    """
+    :param table: Table description from the CLDF metadata.
+    :return: `pyarrow.Schema` for the table.
+    """
+    import pyarrow as pa
+
+    types = {
+        'decimal': pa.float64(),
+        'integer': pa.int64(),
+        'boolean': pa.bool_(),
+        'json': pa.string(),
+    }
+    pk = table['tableSchema'].get('primaryKey', ['ID'])
+    fields = []
+    for col in table['tableSchema']['columns']:
+        type_ = types.get(base_type(col))
+        if col.get('separator'):
+            # List elements are not dictionary-encoded, Parquet encodes the values anyway.
+            type_ = pa.list_(type_ or pa.string())
+        elif type_ is None:  # A string.
+            type_ = pa.string() if [col['name']] == pk else pa.dictionary(pa.int32(), pa.string())
+        fields.append(pa.field(
+            col['name'],
+            type_,
+            metadata={'propertyUrl': col['propertyUrl']} if col.get('propertyUrl') else None))
+    return pa.schema(fields, metadata={
+        'url': table['url'], 'dc:conformsTo': table.get('dc:conformsTo', '')})
+
+
+def arrow_table(table, rows):
+    """
+    :param table: Table description from the CLDF metadata.
+    :param rows: `list` of rows of the table, as read by `pycldf`.
+    :return: `pyarrow.Table`.
+    """
+    import pyarrow as pa
+
+    schema = arrow_schema(table)
+    columns = []
+    for col in table['tableSchema']['columns']:
+        values = [row.get(col['name']) for row in rows]
+        if base_type(col) == 'decimal':
+            values = [None if v is None else float(v) for v in values]
+        elif base_type(col) == 'json':
+            values = [None if v is None else json.dumps(v) for v in values]
+        columns.append(values)
+    return pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema)
+
+
+def write(tab, path, format):
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+
+    # Files are written to a temporary file first, which then replaces an existing file.
+    tmp = path.parent / '.{}.tmp'.format(path.name)
+    if format == 'parquet':
+        pq.write_table(tab, str(tmp), compression='zstd')
+    else:
+        feather.write_feather(tab, str(tmp), compression='zstd')
+    os.replace(tmp, path)
+
+
+def run(args):
+    ds = Dataset()
+    cldf = cldf_snapshot(ds)
+    metadata = jsonlib.load(ds.cldf_dir / ds.cldf_specs().metadata_fname)
+    args.output = args.output or ds.dir / 'parquet'
+    args.output.mkdir(exist_ok=True)
+    for table in metadata['tables']:
+        name = table.get('dc:conformsTo', '').partition('#')[2] or table['url']
+        path = args.output / (pathlib.Path(table['url']).stem + FORMATS[args.format])
+        tab = arrow_table(table, cldf.iter_rows(name))
+        write(tab, path, args.format)
+        args.log.info('{} rows of {} written to {}'.format(tab.num_rows, name, path))
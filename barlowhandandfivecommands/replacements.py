@@ -0,0 +1,80 @@
+"""
+Infer replacement events for ‘hand’ and ‘five’ from the coding of languages and the Glottolog
+classification - following the conservative approach described in the dataset's README - and list
+the differences to the curated events in `replacements.csv`.
+
+Events are compared by the set of languages they subsume; thus, events assigned to different
+languoids of a chain of subgroups with the same member languages are regarded as the same.
+
+    $ cldfbench barlowhandandfive.replacements --glottolog-version v5.0
+"""
+import time
+
+from clldutils.clilib import Table, add_format
+from cldfbench.cli_util import add_catalog_spec
+
+from cldfbench_barlowhandandfive import Dataset, subgroup_members
+from barlowhandandfivecommands.analysis.events import infer_replacements
+from barlowhandandfivecommands.analysis.snapshot import cldf_snapshot
+
+
+def register(parser):
+    parser.add_argument(
+        '--concept',
+        help="Only compare replacement events for this concept.",
+        choices=['hand', 'five'],
+        default=None,
+    )
+    add_format(parser, default='pipe')
+    add_catalog_spec(parser, 'glottolog')
+
+
+def run(args):
+    ds = Dataset()
+    gl_langs, lineages, _ = ds.glottolog_languoids(args)
+    cldf = cldf_snapshot(ds)
+    values = cldf.by_parameter('ValueTable')
+    members = subgroup_members(lineages)
+
+    count = 0
+    with Table(args, 'Concept', 'Status', 'ID', 'Subgroup', 'Glottocode', 'Languages') as t:
+        for concept in [args.concept] if args.concept else ['hand', 'five']:
+            coded = {
+                row['Language_ID']: row['Value']
+                for row in values['repl_{}'.format(concept)]}
+            start = time.perf_counter()
+            inferred = {
+                frozenset(lid for lid in members.get(gc, [gc]) if lid in coded): gc
+                for gc in infer_replacements(coded, lineages)}
+            args.log.info('Inferred {} replacement events for ‘{}’ in {:.1f}ms'.format(
+                len(inferred), concept, (time.perf_counter() - start) * 1000))
+
+            curated = {}
+            for row in cldf.iter_rows('replacements.csv'):
+                if row['Concept'] == concept:
+                    curated.setdefault(frozenset(row['Language_IDs']), []).append(row)
+
+            for lids, rows in curated.items():
+                if lids not in inferred:
+                    for row in rows:
+                        count += 1
+                        t.append([
+                            concept,
+                            'curated only',
+                            row['ID'],
+                            row['Subgroup'],
+                            gl_langs[row['Subgroup']].id if row['Subgroup'] in gl_langs else '',
+                            len(lids),
+                        ])
+            for lids, gc in sorted(inferred.items(), key=lambda i: i[1]):
+                if lids not in curated:
+                    count += 1
+                    t.append([
+                        concept,
+                        'inferred only',
+                        '',
+                        gl_langs[gc].name if gc in gl_langs else '',
+                        gc,
+                        len(lids),
+                    ])
+    args.log.info('{} differences between curated and inferred replacement events'.format(count))
@@ -0,0 +1,79 @@
+"""
+List the forms for ‘hand’ and ‘five’ most similar to a given form - e.g. to spot candidates for
+borrowing or recolexification - ranked by edit distance of the forms, disregarding case, stress
+marks and morpheme boundaries.
+
+    $ cldfbench barlowhandandfive.similar lima --parameter hand -k 5
+"""
+import time
+
+from clldutils.clilib import Table, add_format, ParserError
+from cldfbench.cli_util import add_catalog_spec, IGNORE_MISSING
+
+from cldfbench_barlowhandandfive import Dataset, subgroup_members
+from barlowhandandfivecommands.analysis.similarity import similarity_index
+
+
+def register(parser):
+    parser.add_argument('form', help="Form to search for.")
+    parser.add_argument(
+        '-k',
+        help="Number of forms to list.",
+        type=int,
+        default=10,
+    )
+    parser.add_argument(
+        '--parameter',
+        help="Only list forms for this concept.",
+        choices=['hand', 'five'],
+        default=None,
+    )
+    parser.add_argument(
+        '--dataset',
+        help="Only list forms attested in this source dataset. May be given multiple times.",
+        action='append',
+        default=[],
+    )
+    parser.add_argument(
+        '--subgroup',
+        help="Only list forms of languages in this Glottolog subgroup, specified by name or "
+             "Glottocode (requires the Glottolog catalog).",
+        default=None,
+    )
+    parser.add_argument(
+        '--max-distance',
+        help="Only list forms within this edit distance of the query.",
+        type=int,
+        default=None,
+    )
+    add_format(parser, default='pipe')
+    add_catalog_spec(parser, 'glottolog', default=IGNORE_MISSING)
+
+
+def run(args):
+    ds = Dataset()
+    glottocodes = None
+    if args.subgroup:
+        if not args.glottolog:
+            raise ParserError('Filtering by subgroup requires the Glottolog catalog')
+        gl_langs, lineages, _ = ds.glottolog_languoids(args)
+        if args.subgroup not in gl_langs:
+            raise ParserError('Unknown subgroup: {}'.format(args.subgroup))
+        glottocodes = subgroup_members(lineages).get(gl_langs[args.subgroup].id, [])
+
+    index = similarity_index(ds)
+    start = time.perf_counter()
+    matches = index.query(
+        args.form,
+        k=args.k,
+        parameter=args.parameter,
+        datasets=args.dataset,
+        glottocodes=glottocodes,
+        max_distance=args.max_distance)
+    args.log.info('Searched {} distinct forms in {:.1f}ms'.format(
+        len(index), (time.perf_counter() - start) * 1000))
+
+    with Table(args, 'Distance', 'Form', 'Language', 'Glottocode', 'Parameter', 'Datasets') as t:
+        for m in matches:
+            t.append([
+                m.distance, m.form, m.language_name, m.glottocode, m.parameter, ' '.join(m.datasets)])
@@ -0,0 +1,146 @@
+"""
+Export the CLDF dataset to a SQLite database tuned for lookups.
+
+The database contains the tables of the generic pycldf SQLite dump (see `cldf createdb`), plus
+- indexes on Glottocodes, language names, subgroups, replacement groups and parameters and
+- "materialized views", i.e. tables filled from the joins used for typical lookups:
+  - `language_replacements`: one row per language and replacement event it is subsumed under,
+  - `language_values`: one row per language and coded value or selected form.
+
+So instead of the three-table join described in the README, we can run
+
+    sqlite> select subgroup from language_replacements where language_name = 'Lenkau';
+"""
+import os
+import time
+import sqlite3
+import pathlib
+import contextlib
+
+from pycldf.db import Database
+
+from cldfbench_barlowhandandfive import Dataset
+
+# (name, table, columns)
+INDEXES = [
+    ('languagetable_glottocode', 'LanguageTable', ['cldf_glottocode']),
+    ('languagetable_name', 'LanguageTable', ['cldf_name']),
+    ('formtable_language', 'FormTable', ['cldf_languageReference']),
+    ('formtable_parameter', 'FormTable', ['cldf_parameterReference']),
+    ('codetable_parameter', 'CodeTable', ['cldf_parameterReference']),
+    ('valuetable_language', 'ValueTable', ['cldf_languageReference']),
+    ('valuetable_parameter', 'ValueTable', ['cldf_parameterReference', 'cldf_codeReference']),
+    ('replacements_subgroup', 'replacements.csv', ['Subgroup']),
+    ('replacements_group', 'replacements.csv', ['Replacement_Group']),
+    ('replacements_parameter', 'replacements.csv', ['cldf_parameterReference']),
+    ('replacements_language_replacement', 'replacements.csv_LanguageTable', ['replacements.csv_cldf_id']),
+    ('replacements_language_language', 'replacements.csv_LanguageTable', ['LanguageTable_cldf_id']),
+]
+# (name, query, indexed columns)
+VIEWS = [
+    (
+        'language_replacements',
+        """\
+SELECT
+    l.cldf_id AS language_id,
+    l.cldf_name AS language_name,
+    l.cldf_glottocode AS glottocode,
+    r.cldf_id AS replacement_id,
+    r.cldf_parameterReference AS concept,
+    r.Replacement_Group AS replacement_group,
+    r.Subgroup AS subgroup,
+    r.Comment AS comment,
+    r.Source AS source
+FROM
+    LanguageTable AS l,
+    `replacements.csv_LanguageTable` AS rl,
+    `replacements.csv` AS r
+WHERE
+    l.cldf_id = rl.LanguageTable_cldf_id AND rl.`replacements.csv_cldf_id` = r.cldf_id
+ORDER BY l.cldf_id, r.cldf_id""",
+        [['language_id'], ['language_name'], ['glottocode'], ['subgroup'], ['replacement_group']],
+    ),
+    (
+        'language_values',
+        """\
+SELECT
+    l.cldf_id AS language_id,
+    l.cldf_name AS language_name,
+    l.cldf_glottocode AS glottocode,
+    p.cldf_id AS parameter_id,
+    p.cldf_name AS parameter_name,
+    v.cldf_value AS value,
+    c.cldf_id AS code_id,
+    c.cldf_name AS code_name,
+    v.cldf_comment AS comment
+FROM
+    ValueTable AS v
+    JOIN LanguageTable AS l ON v.cldf_languageReference = l.cldf_id
+    JOIN ParameterTable AS p ON v.cldf_parameterReference = p.cldf_id
+    LEFT JOIN CodeTable AS c ON v.cldf_codeReference = c.cldf_id
+UNION ALL
+SELECT
+    l.cldf_id, l.cldf_name, l.cldf_glottocode, p.cldf_id, p.cldf_name, f.cldf_form, NULL, NULL,
+    f.cldf_comment
+FROM
+    FormTable AS f
+    JOIN LanguageTable AS l ON f.cldf_languageReference = l.cldf_id
+    JOIN ParameterTable AS p ON f.cldf_parameterReference = p.cldf_id
+ORDER BY 1, 4""",
+        [['language_id', 'parameter_id'], ['language_name'], ['glottocode'], ['parameter_id', 'code_id']],
+    ),
+]
+# Lookups from the README, to check the timing of queries against the database.
+EXAMPLES = [
+    ("SELECT subgroup FROM language_replacements WHERE language_name = ?", ('Lenkau',)),
+    ("SELECT language_name FROM language_replacements WHERE subgroup = ?",
+     ('South-East Admiralty',)),
+]
+
+
+def register(parser):
+    parser.add_argument(
+        '--db',
+        help="Path of the SQLite database to create (default: barlowhandandfive.sqlite in the "
+             "dataset directory).",
+        type=pathlib.Path,
+        default=None,
+    )
+
+
+def tune(conn):
+    """
+    Add indexes and materialized views to a database created from the CLDF dataset.
+    """
+    for name, table, cols in INDEXES:
+        conn.execute('CREATE INDEX {} ON `{}` ({})'.format(
+            name, table, ', '.join('`{}`'.format(c) for c in cols)))
+    for name, query, indexes in VIEWS:
+        conn.execute('CREATE TABLE {} AS {}'.format(name, query))
+        for cols in indexes:
+            conn.execute('CREATE INDEX {0}_{1} ON {0} ({2})'.format(
+                name, '_'.join(cols), ', '.join(cols)))
+    # Collect statistics for the query planner:
+    conn.execute('ANALYZE')
+
+
+def run(args):
+    ds = Dataset()
+    args.db = args.db or ds.dir / 'barlowhandandfive.sqlite'
+    cldf = ds.cldf_reader()
+    # The database is created in a temporary file, which then replaces an existing database.
+    tmp = args.db.parent / '.{}.tmp'.format(args.db.name)
+    if tmp.exists():
+        tmp.unlink()
+    Database(cldf, fname=tmp).write_from_tg()
+    with contextlib.closing(sqlite3.connect(str(tmp))) as conn:
+        with conn:
+            tune(conn)
+        conn.execute('VACUUM')
+        for query, params in EXAMPLES:
+            start = time.perf_counter()
+            res = conn.execute(query, params).fetchall()
+            args.log.info('{} rows in {:.3f}ms: {} {}'.format(
+                len(res), (time.perf_counter() - start) * 1000, query, params))
+    os.replace(tmp, args.db)
+    args.log.info('SQLite database written to {}'.format(args.db))
@@ -0,0 +1,223 @@
+"""
+Compute counts of the coded values and contingency tables for pairs of coded parameters and the
+Melanesia classification of languages, with chi-square and Fisher's exact tests.
+"""
+import io
+import csv
+import json
+import math
+import itertools
+
+from clldutils.clilib import ParserError
+from cldfbench_barlowhandandfive import Dataset, PARAMETERS
+from barlowhandandfivecommands.analysis.matrix import code_matrix
+
+MELANESIA = 'Melanesia'
+
+
+def register(parser):
+    parser.add_argument(
+        '--format',
+        choices=['md', 'csv', 'json'],
+        default='md',
+    )
+    parser.add_argument(
+        '--pair',
+        help="Pair of variables to cross-tabulate, specified as `<PID>:<PID>`, where `Melanesia` "
+             "can be used as variable, too. May be given multiple times. By default all pairs are "
+             "tabulated.",
+        action='append',
+        default=[],
+    )
+    parser.add_argument(
+        '--by-melanesia',
+        help="Additionally tabulate pairs of parameters for languages in and outside of Melanesia.",
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--output',
+        help="Path of the file to write the results to; by default results are printed.",
+        default=None,
+    )
+
+
+def chi2_sf(x, dof):
+    """
+    Survival function of the chi-square distribution for integer degrees of freedom, computed from
+    the closed-form series for even and odd `dof`.
+    """
+    if x <= 0:
+        return 1.0
+    if dof % 2 == 0:
+        term = res = math.exp(-x / 2)
+        for i in range(1, dof // 2):
+            term *= x / (2 * i)
+            res += term
+        return min(res, 1.0)
+    res = math.erfc(math.sqrt(x / 2))
+    term = math.sqrt(2 * x / math.pi) * math.exp(-x / 2)
+    for i in range(1, (dof + 1) // 2):
+        res += term
+        term *= x / (2 * i + 1)
+    return min(res, 1.0)
+
+
+def chi_square(counts):
+    """
+    Pearson's chi-square test of independence. Codes which do not occur are disregarded.
+
+    :return: triple `(statistic, degrees of freedom, p-value)` or `None` for degenerate tables.
+    """
+    import numpy
+
+    counts = counts[counts.sum(axis=1) > 0][:, counts.sum(axis=0) > 0]
+    # Empty tables, or tables with a single row or column, are degenerate:
+    if counts.size == 0 or min(counts.shape) < 2:
+        return None
+    dof = (counts.shape[0] - 1) * (counts.shape[1] - 1)
+    expected = numpy.outer(counts.sum(axis=1), counts.sum(axis=0)) / counts.sum()
+    stat = float(((counts - expected) ** 2 / expected).sum())
+    return stat, dof, chi2_sf(stat, dof)
+
+
+def fisher_exact(counts):
+    """
+    Two-sided Fisher's exact test for tables which are 2x2 after disregarding codes which do not
+    occur.
+
+    :return: p-value or `None` for tables of other shapes.
+    """
+    counts = counts[counts.sum(axis=1) > 0][:, counts.sum(axis=0) > 0]
+    if counts.shape != (2, 2):
+        return None
+    (a, b), (c, d) = counts.tolist()
+    r1, r2, c1, n = a + b, c + d, a + c, a + b + c + d
+
+    def p(x):
+        return math.comb(r1, x) * math.comb(r2, c1 - x) / math.comb(n, c1)
+
+    observed = p(a)
+    return min(1.0, sum(
+        px for px in (p(x) for x in range(max(0, c1 - r2), min(r1, c1) + 1))
+        if px <= observed * (1 + 1e-7)))
+
+
+def tables(matrix, pairs, by_melanesia=False):
+    """
+    Compute contingency tables.
+
+    :param matrix: `CodeMatrix` of the dataset.
+    :param pairs: `list` of pairs of variables.
+    :return: generator of `dict`s describing the tables.
+    """
+    import numpy
+
+    strata = [(None, None)]
+    if by_melanesia:
+        strata.extend([('{}=yes'.format(MELANESIA), matrix.melanesia),
+                       ('{}=no'.format(MELANESIA), ~matrix.melanesia)])
+    for v1, v2 in pairs:
+        if MELANESIA in (v1, v2):
+            pid = v2 if v1 == MELANESIA else v1
+            counts = numpy.stack(
+                [matrix.counts(pid, mask=~matrix.melanesia), matrix.counts(pid, mask=matrix.melanesia)],
+                axis=1)
+            yield table(v1, v2, None, counts.T if v1 == MELANESIA else counts)
+            continue
+        for stratum, mask in strata:
+            yield table(v1, v2, stratum, matrix.crosstab(v1, v2, mask=mask))
+
+
+def labels(variable):
+    if variable == MELANESIA:
+        return ['no', 'yes']
+    return [list(codes) for (pid, _, _), codes in PARAMETERS.items() if pid == variable][0]
+
+
+def table(v1, v2, stratum, counts):
+    chi2, fisher = chi_square(counts), fisher_exact(counts)
+    return dict(
+        variables=[v1, v2],
+        stratum=stratum,
+        rows=labels(v1),
+        columns=labels(v2),
+        counts=counts.tolist(),
+        n=int(counts.sum()),
+        chi2=chi2[0] if chi2 else None,
+        dof=chi2[1] if chi2 else None,
+        p=chi2[2] if chi2 else None,
+        fisher_p=fisher,
+    )
+
+
+def markdown(counts, tabs):
+    def fmt(v):
+        return '' if v is None else ('{:.4g}'.format(v) if isinstance(v, float) else str(v))
+
+    res = ['# Counts\n']
+    for var, cs in counts.items():
+        res.append('## {}\n'.format(var))
+        res.append('Value | Count')
+        res.append('--- | ---:')
+        res.extend('{} | {}'.format(k, v) for k, v in cs.items())
+        res.append('')
+    res.append('# Contingency tables\n')
+    for t in tabs:
+        res.append('## {} × {}{}\n'.format(
+            t['variables'][0], t['variables'][1], ' ({})'.format(t['stratum']) if t['stratum'] else ''))
+        res.append('&nbsp; | {}'.format(' | '.join(t['columns'])))
+        res.append('--- | {}'.format(' | '.join('---:' for _ in t['columns'])))
+        for label, row in zip(t['rows'], t['counts']):
+            res.append('{} | {}'.format(label, ' | '.join(str(c) for c in row)))
+        res.append('\nN = {}, χ² = {}, df = {}, p = {}{}\n'.format(
+            t['n'], fmt(t['chi2']), fmt(t['dof']), fmt(t['p']),
+            ', Fisher p = {}'.format(fmt(t['fisher_p'])) if t['fisher_p'] is not None else ''))
+    return '\n'.join(res)
+
+
+def long_csv(counts, tabs):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(['Variable_1', 'Value_1', 'Variable_2', 'Value_2', 'Stratum', 'Measure', 'Value'])
+    for var, cs in counts.items():
+        for k, v in cs.items():
+            writer.writerow([var, k, '', '', '', 'count', v])
+    for t in tabs:
+        v1, v2 = t['variables']
+        for (i, r), (j, c) in itertools.product(enumerate(t['rows']), enumerate(t['columns'])):
+            writer.writerow([v1, r, v2, c, t['stratum'] or '', 'count', t['counts'][i][j]])
+        for measure in ['n', 'chi2', 'dof', 'p', 'fisher_p']:
+            if t[measure] is not None:
+                writer.writerow([v1, '', v2, '', t['stratum'] or '', measure, t[measure]])
+    return out.getvalue()
+
+
+def run(args):
+    matrix = code_matrix(Dataset())
+    variables = [pid for (pid, _, _), codes in PARAMETERS.items() if codes] + [MELANESIA]
+    pairs = [tuple(p.split(':')) for p in args.pair] or list(itertools.combinations(variables, 2))
+    for pair in pairs:
+        if len(pair) != 2 or not all(v in variables for v in pair) or pair[0] == pair[1]:
+            raise ParserError(
+                'Invalid pair {}: specify pairs as `<PID>:<PID>` with two distinct PIDs from {}'.format(
+                    ':'.join(pair), ', '.join(variables)))
+
+    counts = {
+        pid: {label: int(n) for label, n in zip(labels(pid), matrix.counts(pid))}
+        for pid in variables if pid != MELANESIA}
+    counts[MELANESIA] = {
+        'no': int((~matrix.melanesia).sum()), 'yes': int(matrix.melanesia.sum())}
+    tabs = list(tables(matrix, pairs, by_melanesia=args.by_melanesia))
+
+    if args.format == 'json':
+        res = json.dumps(dict(counts=counts, tables=tabs), indent=2, ensure_ascii=False)
+    elif args.format == 'csv':
+        res = long_csv(counts, tabs)
+    else:
+        res = markdown(counts, tabs)
+    if args.output:
+        with open(args.output, 'w', encoding='utf8') as f:
+            f.write(res)
+    else:
+        print(res)
@@ -0,0 +1,383 @@
+"""
+Benchmarks for the stages of `Dataset.cmd_makecldf`, run on synthetically scaled raw data, and a
+check of the time it takes to import the dataset module and commands.
+
+Run with
+
+    pytest benchmark.py
+
+The scaling factors for the raw data can be set via the environment variable
+`BENCHMARK_SCALES`, e.g. `BENCHMARK_SCALES=1,10 pytest benchmark.py`. The budget (in seconds) for
+importing the dataset module and commands - on top of `cldfbench` - can be set via the environment
+variable `BENCHMARK_IMPORT_BUDGET`.
+"""
+import os
+import sys
+import csv
+import math
+import json
+import random
+import shutil
+import logging
+import pathlib
+import argparse
+import itertools
+import types
+import pkgutil
+import subprocess
+
+import pytest
+
+from cldfbench_barlowhandandfive import (
+    Dataset, FormIndex, FORM_COLUMNS, Value, austronesian_languoids, bucket_by_code,
+)
+from barlowhandandfivecommands.analysis.events import infer_replacements
+
+REPOS = pathlib.Path(__file__).parent
+SCALES = [int(s) for s in os.environ.get('BENCHMARK_SCALES', '1,10,100').split(',')]
+IMPORT_BUDGET = float(os.environ.get('BENCHMARK_IMPORT_BUDGET', '0.05'))
+# Dependencies which must only be imported by the code paths using them, not when `cldfbench`
+# discovers the commands:
+LAZY_IMPORTS = ['numpy', 'shapely', 'cldfviz', 'concurrent.futures.process', 'pyarrow']
+# Subgroup names in the raw data which are corrected in `cmd_makecldf`:
+SUBGROUPS = {
+    'East Choiseul3': 'East Choiseul',
+    'Mainland New Caledonia': 'Mainland New Caledonian',
+}
+
+
+class Glottocodes:
+    """
+    Derive plausible Glottocodes for copies of languoids, which are distinct from each other and
+    from the Glottocodes in the raw data.
+    """
+    def __init__(self, reserved):
+        self.used, self.codes = set(reserved), {}
+
+    def __call__(self, gc, copy):
+        """
+        :return: The Glottocode for the `copy`-th copy of the languoid with Glottocode `gc`.
+        """
+        if copy == 0 or not gc:
+            return gc
+        if (gc, copy) not in self.codes:
+            # The letters of the code after the first one are derived from the number of the copy,
+            # or - in case of collisions - from the next free number.
+            for n in itertools.count(copy):
+                code = gc[0] + ''.join(
+                    chr(ord('a') + n // 26 ** i % 26) for i in reversed(range(3))) + gc[4:]
+                if code not in self.used:
+                    break
+            self.used.add(code)
+            self.codes[gc, copy] = code
+        return self.codes[gc, copy]
+
+
+def name(n, copy):
+    return '{} {}'.format(n, copy) if copy and n else n
+
+
+def read(fname, delimiter):
+    with REPOS.joinpath('raw', fname).open(encoding='utf8', newline='') as f:
+        rows = list(csv.DictReader(f, delimiter=delimiter))
+    return rows[0].keys() if rows else [], rows
+
+
+def write(d, fname, delimiter, header, rows):
+    with d.joinpath('raw', fname).open('w', encoding='utf8', newline='') as f:
+        w = csv.DictWriter(f, header, delimiter=delimiter)
+        w.writeheader()
+        w.writerows(rows)
+
+
+def scale_raw_data(d, scale):
+    """
+    Write a copy of the raw data to `d`, with each language (and subgroup) replicated `scale`
+    times, using distinct Glottocodes, names and slightly shifted coordinates.
+    """
+    d.joinpath('raw').mkdir(parents=True)
+    shutil.copy(REPOS / 'metadata.json', d)
+    rnd = random.Random(scale)
+    reserved = set()
+    for fname, delimiter, cols in [
+        ('Colexification_of_hand_and_five_in_Austronesian_languages.tsv', '\t', ['Glottocode']),
+        ('Forms_of_hand_and_five_in_Austronesian_languages.tsv',
+         '\t',
+         ['Glottocode', 'Language_level_glottocode']),
+        ('values.csv', ',', ['Language_ID']),
+        ('num_syst.csv', ',', ['Language_ID']),
+    ]:
+        reserved.update(row[col] for row in read(fname, delimiter)[1] for col in cols)
+    glottocode = Glottocodes(reserved)
+
+    fname = 'Colexification_of_hand_and_five_in_Austronesian_languages.tsv'
+    header, rows = read(fname, '\t')
+    nlangs, res = len(rows), []
+    for copy, row in itertools.product(range(scale), rows):
+        row = dict(row)
+        row['Language_number'] = str(int(row['Language_number']) + copy * nlangs)
+        row['Glottocode'] = glottocode(row['Glottocode'], copy)
+        row['Language_name'] = name(row['Language_name'], copy)
+        if copy:
+            row['Latitude'] = str(round(float(row['Latitude']) + rnd.uniform(-0.5, 0.5), 4))
+            row['Longitude'] = str(round(float(row['Longitude']) + rnd.uniform(-0.5, 0.5), 4))
+        res.append(row)
+    assert len({row['Glottocode'] for row in res}) == len(res)
+    write(d, fname, '\t', header, res)
+
+    fname = 'Forms_of_hand_and_five_in_Austronesian_languages.tsv'
+    header, rows = read(fname, '\t')
+    res = []
+    for copy, row in itertools.product(range(scale), rows):
+        row = dict(row)
+        for col in ['Glottocode', 'Language_level_glottocode']:
+            row[col] = glottocode(row[col], copy)
+        row['Language_name'] = name(row['Language_name'], copy)
+        res.append(row)
+    write(d, fname, '\t', header, res)
+
+    for fname in ['values.csv', 'num_syst.csv']:
+        header, rows = read(fname, ',')
+        res = []
+        for copy, row in itertools.product(range(scale), rows):
+            row = dict(row)
+            row['Language_ID'] = glottocode(row['Language_ID'], copy)
+            row['ID'] = '{}-{}'.format(row['ID'].rpartition('-')[0], row['Language_ID'])
+            res.append(row)
+        assert len({row['ID'] for row in res}) == len(res)
+        write(d, fname, ',', header, res)
+
+    for concept in ['hand', 'five']:
+        fname = 'Replacements_of_{}_in_Austronesian.tsv'.format(concept)
+        header, rows = read(fname, '\t')
+        res = []
+        for copy, row in itertools.product(range(scale), rows):
+            row = dict(row)
+            row['Higher_count'] = str(int(row['Higher_count']) + copy * len(rows))
+            row['Lower_count'] = '{}{}'.format(
+                int(row['Lower_count'][:-1]) + copy * len(rows), row['Lower_count'][-1])
+            row['Subgroup'] = name(
+                SUBGROUPS.get(row['Subgroup'].strip(), row['Subgroup']) if copy else row['Subgroup'],
+                copy)
+            res.append(row)
+        write(d, fname, '\t', header, res)
+
+    # A rough approximation of the Papuan provinces of Indonesia, with high-resolution boundaries:
+    def polygon(lon, lat, rlon, rlat, n=2000):
+        ring = []
+        for i in range(n):
+            angle, jitter = 2 * math.pi * i / n, 1 + 0.05 * rnd.random()
+            ring.append([
+                round(lon + rlon * jitter * math.cos(angle), 5),
+                round(lat + rlat * jitter * math.sin(angle), 5)])
+        return [ring + [ring[0]]]
+
+    features = [
+        {'type': 'Feature', 'properties': {}, 'geometry': {
+            'type': 'Polygon', 'coordinates': polygon(*args)}}
+        for args in [(133, -2, 2.5, 1.5), (138.5, -4.5, 2.5, 3.5)]]
+    d.joinpath('raw', 'idn_papuan_provinces.geojson').write_text(
+        json.dumps({'type': 'FeatureCollection', 'features': features}), encoding='utf8')
+
+
+class Languoid(types.SimpleNamespace):
+    pass
+
+
+class Glottolog:
+    """
+    Stub for the parts of the `pyglottolog.Glottolog` API used in `cmd_makecldf`, derived from the
+    (scaled) raw data.
+    """
+    languoid_levels = types.SimpleNamespace(family='family', language='language', dialect='dialect')
+
+    def __init__(self, d):
+        def read(fname):
+            with d.joinpath('raw', fname).open(encoding='utf8', newline='') as f:
+                return [
+                    {k: (v or '').strip() for k, v in r.items()}
+                    for r in csv.DictReader(f, delimiter='\t')]
+
+        langs = read('Colexification_of_hand_and_five_in_Austronesian_languages.tsv')
+        names = {r['Glottocode']: r['Language_name'] for r in langs}
+        family = ('Austronesian', 'aust1307', 'family')
+        lineages = {r['Glottocode']: [family] for r in langs}
+        self._languoids = [Languoid(
+            id='aust1307', name='Austronesian', level='family', lineage=[], countries=[],
+            latitude=None, longitude=None)]
+
+        # Subgroups are assigned blocks of consecutive languages of the appropriate size, starting
+        # at a position derived from the subgroup name.
+        subgroups = {}
+        for concept in ['hand', 'five']:
+            for r in read('Replacements_of_{}_in_Austronesian.tsv'.format(concept)):
+                sg = SUBGROUPS.get(r['Subgroup'], r['Subgroup'])
+                if sg not in subgroups and sg not in names.values():
+                    subgroups[sg] = int(r['Number_of_languages_in_sample'] or 1)
+        for i, (sg, size) in enumerate(
+                sorted(subgroups.items(), key=lambda i: (-i[1], i[0]))):
+            gc = 'sgrp{:04d}'.format(i) if i < 10000 else 'sg{:06d}'.format(i)
+            start = sum(map(ord, sg)) * 7919 % max(len(langs) - size, 1)
+            for r in langs[start:start + size]:
+                lineages[r['Glottocode']].append((sg, gc, 'family'))
+            self._languoids.append(Languoid(
+                id=gc, name=sg, level='family', lineage=[family], countries=[],
+                latitude=None, longitude=None))
+
+        for r in langs:
+            lon, lat = float(r['Longitude']), float(r['Latitude'])
+            countries = {'ID'} if lon < 141 else ({'PG'} if lat < 0 and lon < 160 else {'FJ'})
+            if r['Glottocode'] in {'tons1239', 'gilb1244'}:
+                countries.add('SB')
+            self._languoids.append(Languoid(
+                id=r['Glottocode'],
+                name=names[r['Glottocode']],
+                level='language',
+                lineage=lineages[r['Glottocode']],
+                countries=[types.SimpleNamespace(id=c) for c in sorted(countries)],
+                latitude=lat,
+                longitude=lon))
+
+        dialects = set()
+        for r in read('Forms_of_hand_and_five_in_Austronesian_languages.tsv'):
+            gc, lgc = r['Glottocode'], r['Language_level_glottocode']
+            if gc and gc not in names and gc not in dialects and lgc in lineages:
+                dialects.add(gc)
+                self._languoids.append(Languoid(
+                    id=gc, name=gc, level='dialect',
+                    lineage=lineages[lgc] + [(names[lgc], lgc, 'language')],
+                    countries=[], latitude=None, longitude=None))
+
+    def languoids(self):
+        return iter(self._languoids)
+
+
+class Catalog:
+    def __init__(self, d):
+        self.api = Glottolog(d)
+
+    def is_dirty(self):
+        # Report uncommitted changes, so that the Glottolog snapshot is not used.
+        return True
+
+
+@pytest.fixture(scope='module', params=SCALES, ids=lambda s: '{}x'.format(s))
+def dataset(request, tmp_path_factory):
+    d = tmp_path_factory.mktemp('barlowhandandfive-{}x'.format(request.param))
+    scale_raw_data(d, request.param)
+    ds = type('BenchmarkDataset', (Dataset,), {'dir': d})()
+    args = argparse.Namespace(
+        glottolog=Catalog(d), log=logging.getLogger(__name__), dev=False, verbose=False)
+    return ds, args
+
+
+def makecldf(ds, args):
+    shutil.rmtree(ds.cache_dir, ignore_errors=True)
+    args.writer = ds.cldf_writer(args).__enter__()
+    ds.cmd_makecldf(args)
+    # Rows are generated lazily, so we materialize them to include them in the benchmark.
+    for table, rows in args.writer.objects.items():
+        args.writer.objects[table] = list(rows)
+    return args.writer
+
+
+def test_glottolog_scan(benchmark, dataset):
+    ds, args = dataset
+    _, lineages, _ = benchmark(austronesian_languoids, args.glottolog.api)
+    assert lineages
+
+
+def test_forms_index(benchmark, dataset):
+    ds, _ = dataset
+    index = benchmark(
+        lambda: FormIndex(ds.iterrows(
+            'Forms_of_hand_and_five_in_Austronesian_languages', columns=FORM_COLUMNS)))
+    assert index.glottocodes
+
+
+def test_melanesia_classification(benchmark, dataset):
+    ds, _ = dataset
+    coords = {
+        r['Glottocode']: (float(r['Longitude']), float(r['Latitude'])) for r in
+        ds.iterrows('Colexification_of_hand_and_five_in_Austronesian_languages')}
+    res = benchmark(ds.in_papuan_provinces, coords)
+    assert any(res.values())
+
+
+def test_replacement_inference(benchmark, dataset):
+    ds, args = dataset
+    _, lineages, _ = austronesian_languoids(args.glottolog.api)
+    values = {
+        r['Glottocode']: r['Was_there_lexical_replacement_of_hand?'] for r in
+        ds.iterrows('Colexification_of_hand_and_five_in_Austronesian_languages')}
+    res = benchmark(infer_replacements, values, lineages)
+    assert res
+
+
+def test_row_generation(benchmark, dataset):
+    ds, args = dataset
+    writer = benchmark.pedantic(makecldf, args=dataset, rounds=3)
+    assert writer.objects['ValueTable']
+
+
+def test_valuetable_sort(benchmark, dataset):
+    ds, args = dataset
+    writer = makecldf(ds, args)
+    order = {r['ID']: i + 1 for i, r in enumerate(writer.objects['CodeTable'])}
+    values = [Value(**r) for r in writer.objects['ValueTable']]
+    random.Random(1).shuffle(values)
+    res = benchmark(bucket_by_code, values, order)
+    assert sum(len(bucket) for bucket in res) == len(values)
+
+
+def test_write(benchmark, dataset):
+    ds, args = dataset
+    writer = makecldf(ds, args)
+    benchmark.pedantic(
+        writer.write, kwargs=dict(zipped=writer.cldf_spec.zipped, **writer.objects), rounds=3)
+    assert ds.cldf_dir.joinpath('values.csv').exists()
+
+
+def import_times():
+    """
+    Import the dataset module and commands - after `cldfbench` - in a subprocess run with
+    `python -X importtime`.
+
+    :return: pair `(modules, total)`, where `modules` maps names of the modules imported on top of \
+    `cldfbench` to their cumulative import time and `total` is the sum of the import times of the \
+    top-level imports, in seconds.
+    """
+    import barlowhandandfivecommands
+
+    names = ['cldfbench_barlowhandandfive'] + [
+        '{}.{}'.format(barlowhandandfivecommands.__name__, m.name)
+        for m in pkgutil.iter_modules(barlowhandandfivecommands.__path__)]
+    # As in regular use, modules are imported from cached bytecode:
+    env = {k: v for k, v in os.environ.items() if k != 'PYTHONDONTWRITEBYTECODE'}
+    modules, total = {}, 0
+    for line in subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import cldfbench.__main__\nimport {}'.format(', '.join(names))],
+            cwd=str(REPOS), env=env, check=True, capture_output=True, text=True).stderr.splitlines():
+        if line.count('|') != 2:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():  # The header line.
+            continue
+        # Nested imports are indented, and reported before the importing module.
+        if name == ' cldfbench.__main__':
+            # Everything imported so far is imported by `cldfbench` anyway.
+            modules, total = {}, 0
+            continue
+        modules[name.strip()] = int(cumulative) / 1e6
+        if not name.startswith('  '):
+            total += int(cumulative) / 1e6
+    return modules, total
+
+
+def test_import_time():
+    # A first run may compile the modules, so we measure the best of three subsequent runs.
+    import_times()
+    modules, total = min((import_times() for _ in range(3)), key=lambda r: r[1])
+    assert not [m for m in LAZY_IMPORTS if m in modules]
+    assert total < IMPORT_BUDGET, sorted(modules.items(), key=lambda i: -i[1])[:10]
@@ -1,12 +1,39 @@
+import os
+import sys
+import csv
+import time
+import json
+import pickle
+import shutil
+import hashlib
+import tempfile
+import functools
 import pathlib
+import platform
+import itertools
+import contextlib
 import collections
+from concurrent import futures
 
-from shapely.geometry import shape, Point
-from shapely import distance
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # Not available on Windows.
+
+from csvw.dsv import reader
 from clldutils.misc import slug
-from clldutils.jsonlib import load
+from clldutils.path import md5
+from clldutils.jsonlib import load, dump
 from clldutils.markup import add_markdown_text
-from cldfbench import Dataset as BaseDataset, CLDFSpec
+from cldfbench import Dataset as BaseDataset, CLDFSpec, CLDFWriter
+# numpy and shapely are imported in the functions using them, because this module is imported by
+# each invocation of `cldfbench`, via the `barlowhandandfive` commands.
+
+# Set this environment variable to a non-empty value to record a profile of the build stages.
+PROFILE_ENV_VAR = 'BARLOWHANDANDFIVE_PROFILE'
+# Set this environment variable to a non-empty value to only rebuild CLDF tables whose inputs
+# changed since the last incremental build.
+INCREMENTAL_ENV_VAR = 'BARLOWHANDANDFIVE_INCREMENTAL'
 
 BARLOW_2023 = """\
 @article{Barlow2023,
@@ -318,16 +345,698 @@ CONTRIBUTIONS = {  # ID, Name, Citation
 }
 
 
+# Lightweight stand-in for `pyglottolog.languoids.Languoid`, holding just the attributes we need,
+# so that the relevant part of the Glottolog tree can be cached on disk.
+Languoid = collections.namedtuple('Languoid', ['id', 'name', 'latitude', 'longitude'])
+
+
+def austronesian_languoids(glottolog):
+    """
+    Walk the Glottolog tree and collect the data we need about Austronesian languoids.
+
+    :param glottolog: `pyglottolog.Glottolog` instance.
+    :return: triple `(gl_langs, lineages, gl_countries)`, where `gl_langs` maps Glottocodes and \
+    names to `Languoid` objects, `lineages` maps Glottocodes of languages to the tuple of Glottocodes \
+    of their ancestors - ordered from the family down to the parent - and `gl_countries` maps \
+    Glottocodes to sets of country codes.
+    """
+    gl_langs, lineages, gl_countries = {}, {}, {}
+    for lg in glottolog.languoids():
+        if lg.lineage and lg.lineage[0][1] == 'aust1307':
+            if lg.level == glottolog.languoid_levels.language:
+                lineages[lg.id] = tuple(gc for _, gc, _ in lg.lineage)
+            gl_countries[lg.id] = {c.id for c in lg.countries}
+            gl_langs[lg.id] = Languoid(lg.id, lg.name, lg.latitude, lg.longitude)
+            if lg.id == 'amba1266':  # Amba (Solomon Islands)
+                gl_langs['Amba'] = gl_langs[lg.id]
+            gl_langs[lg.name] = gl_langs[lg.id]
+    return gl_langs, lineages, gl_countries
+
+
+def subgroup_members(lineages):
+    """
+    Invert language lineages into an index of descendant languages, e.g. to look up which languages
+    fall under a subgroup: `subgroup_members(lineages)[gl_langs['South-East Admiralty'].id]`.
+
+    :param lineages: `dict` mapping Glottocodes of languages to ancestor Glottocodes.
+    :return: `dict` mapping Glottocodes of subgroups to the sorted list of Glottocodes of their \
+    member languages. Languages are mapped to a list containing just themselves.
+    """
+    members = collections.defaultdict(list)
+    for lid, lineage in lineages.items():
+        members[lid].append(lid)
+        for gc in lineage:
+            members[gc].append(lid)
+    return {gc: sorted(lids) for gc, lids in members.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def record_type(columns):
+    """
+    :return: `namedtuple` type for rows with the given columns (which must be valid identifiers).
+    """
+    return collections.namedtuple('Row', columns)
+
+
+# The columns of the forms TSV we need to index the forms:
+FORM_COLUMNS = [
+    'Language_name', 'Glottocode', 'Language_level_glottocode', 'Parameter_ID', 'Form', 'Dataset']
+Provenance = collections.namedtuple('Provenance', ['dataset', 'glottocode', 'language_name'])
+
+
+class FormIndex:
+    """
+    Index of the forms for ‘hand’ and ‘five’ collected from the source datasets.
+
+    Forms are indexed by language-level Glottocode, parameter and form, and map to the list of
+    `Provenance` records of the varieties in source datasets for which the form is attested.
+    """
+    def __init__(self, rows):
+        """
+        :param rows: Rows of `raw/Forms_of_hand_and_five_in_Austronesian_languages.tsv`, with \
+        (at least) the `FORM_COLUMNS` as attributes.
+        """
+        self.glottocodes = set()
+        self._forms = collections.defaultdict(list)
+        order, index = {}, collections.defaultdict(dict)
+        for row in rows:
+            gc = row.Glottocode or row.Language_level_glottocode
+            if not gc:
+                continue
+            self.glottocodes.add(gc)
+            lgc, pid = row.Language_level_glottocode, row.Parameter_ID
+            prov = Provenance(row.Dataset, gc, row.Language_name)
+            # Provenance records are ordered by first appearance of the variety in the data.
+            order.setdefault((lgc, prov), len(order))
+            if (lgc, pid, row.Form) not in index:
+                self._forms[lgc, pid].append(row.Form)
+            index[lgc, pid, row.Form][prov] = order[lgc, prov]
+        self._index = {
+            k: sorted(v, key=lambda prov: v[prov]) for k, v in index.items()}
+
+    def provenance(self, glottocode, parameter, form):
+        """
+        :return: `list` of `Provenance` records for a form.
+        """
+        return self._index.get((glottocode, parameter, form), [])
+
+    def forms(self, glottocode, parameter):
+        """
+        :return: `list` of distinct forms attested for a language and parameter.
+        """
+        return self._forms.get((glottocode, parameter), [])
+
+
+def peak_rss():
+    """
+    :return: Maximum resident set size in bytes of this process and its (waited for) children, \
+    or `None` if this cannot be determined on the platform.
+    """
+    if resource is None:  # pragma: no cover
+        return None
+    res = max(resource.getrusage(who).ru_maxrss
+              for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN])
+    # ru_maxrss is reported in kilobytes on Linux, but in bytes on macOS.
+    return res if sys.platform == 'darwin' else res * 1024
+
+
+def current_rss():
+    """
+    :return: Current resident set size in bytes of this process, or `None` if this cannot be \
+    determined on the platform.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):  # pragma: no cover
+        return None  # Not Linux.
+
+
+class Profile:
+    """
+    Opt-in instrumentation of the stages of a build, recording wall time, CPU time, resident set
+    size at the start and end of the stage and - where applicable - row counts per stage. The
+    maximum resident set size of the process is recorded for the whole build.
+
+    Usage:
+
+    .. code-block:: python
+
+        profile = Profile()
+        with profile.stage('colexification') as stage:
+            rows = list(...)
+            stage['rows'] = len(rows)
+        profile.write(path)
+
+    If the profile is not enabled, stages are not recorded and no report is written.
+
+    Stages may run concurrently in different threads. Thus, stages record their start (relative to
+    the creation of the profile) and the CPU time of the thread running the stage. Memory figures,
+    though, are those of the process, i.e. include allocations of concurrent stages.
+    """
+    def __init__(self, enabled=None):
+        """
+        :param enabled: Whether to record stages. Defaults to whether the environment variable \
+        `BARLOWHANDANDFIVE_PROFILE` is set.
+        """
+        self.enabled = bool(os.environ.get(PROFILE_ENV_VAR)) if enabled is None else enabled
+        self.stages = []
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Record the stage executed within the context.
+
+        :return: The `dict` recording the stage, to which the caller may add counts like `rows`.
+        """
+        record = collections.OrderedDict([('name', name)])
+        if not self.enabled:
+            yield record
+            return
+        wall, cpu, rss = time.perf_counter(), time.thread_time(), current_rss()
+        try:
+            yield record
+        finally:
+            record['start'] = round(wall - self.started, 4)
+            record['wall_time'] = round(time.perf_counter() - wall, 4)
+            record['cpu_time'] = round(time.thread_time() - cpu, 4)
+            record['rss_start'], record['rss_end'] = rss, current_rss()
+            record['rss_delta'] = None if rss is None or record['rss_end'] is None \
+                else record['rss_end'] - rss
+            self.stages.append(record)
+
+    def write(self, path):
+        """
+        Write the profile as JSON report to `path`, if enabled.
+        """
+        if self.enabled:
+            # Since stages may overlap, the total wall time is the time from the start of the
+            # first to the end of the last stage.
+            wall_time = max((s['start'] + s['wall_time'] for s in self.stages), default=0) - \
+                min((s['start'] for s in self.stages), default=0)
+            dump(
+                collections.OrderedDict([
+                    ('created', time.strftime('%Y-%m-%dT%H:%M:%S')),
+                    ('python', platform.python_version()),
+                    ('platform', platform.platform()),
+                    ('wall_time', round(wall_time, 4)),
+                    ('cpu_time', round(sum(s['cpu_time'] for s in self.stages), 4)),
+                    ('max_rss', peak_rss()),
+                    ('stages', self.stages),
+                ]),
+                path,
+                indent=2)
+
+
+# The inputs of the CLDF tables which may be reused in incremental builds: Raw data files, the
+# Glottolog version and the `PARAMETERS` definitions.
+DEPENDENCIES = {
+    'LanguageTable': [
+        'Colexification_of_hand_and_five_in_Austronesian_languages.tsv',
+        'idn_papuan_provinces.geojson',
+        'glottolog',
+    ],
+    'FormTable': [
+        'Colexification_of_hand_and_five_in_Austronesian_languages.tsv',
+        'Forms_of_hand_and_five_in_Austronesian_languages.tsv',
+        'glottolog',
+    ],
+    'ValueTable': [
+        'Colexification_of_hand_and_five_in_Austronesian_languages.tsv',
+        'values.csv',
+        'num_syst.csv',
+        'PARAMETERS',
+    ],
+    'replacements.csv': [
+        'Replacements_of_five_in_Austronesian.tsv',
+        'Replacements_of_hand_in_Austronesian.tsv',
+        'glottolog',
+    ],
+}
+
+
+def checksum(*data):
+    """
+    Compute a checksum over JSON-serializable data.
+    """
+    return hashlib.md5(
+        json.dumps(data, sort_keys=True, default=str).encode('utf8')).hexdigest()
+
+
+def read_snapshot(path):
+    """
+    :return: The pair `(key, object)` pickled in a snapshot, or `None` if there is no readable \
+    snapshot.
+    """
+    try:
+        with path.open('rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        # A truncated snapshot - or one referring to classes or modules which no longer exist -
+        # is a miss.
+        return None
+
+
+def write_snapshot(path, key, obj):
+    """
+    Pickle the pair `(key, obj)` to a snapshot.
+
+    The snapshot is written to a temporary file first, which then replaces an existing snapshot,
+    so that an interrupted write does not leave a truncated snapshot behind.
+    """
+    path.parent.mkdir(exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+            dir=str(path.parent), prefix='.{}.'.format(path.name), suffix='.tmp', delete=False) as f:
+        try:
+            pickle.dump((key, obj), f, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+class Writer(CLDFWriter):
+    """
+    The `CLDFWriter` used for `cmd_makecldf`, providing
+
+    - a `Profile` of the build, which also records writing the CLDF data and is written to
+      `makecldf.profile.json` next to the CLDF directory;
+    - incremental builds: If the environment variable `BARLOWHANDANDFIVE_INCREMENTAL` is set, the
+      written tables are snapshotted in `.cache/cldf/`, and tables whose inputs did not change are
+      copied from this snapshot in the next incremental build, rather than being rebuilt.
+    """
+    def __init__(self, *args, **kw):
+        CLDFWriter.__init__(self, *args, **kw)
+        self.profile = Profile()
+        self.incremental = bool(os.environ.get(INCREMENTAL_ENV_VAR))
+        self.fingerprints, self.reused = {}, {}
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type:
+            # The data of a failed build must not end up in the snapshot:
+            self.incremental = False
+        return CLDFWriter.__exit__(self, exc_type, exc_val, exc_tb)
+
+    @property
+    def snapshot_dir(self):
+        return self.dataset.cache_dir / 'cldf'
+
+    def rebuild(self, fingerprints):
+        """
+        Determine the tables which must be rebuilt.
+
+        :param fingerprints: `dict` mapping table names to fingerprints of their inputs (or \
+        `None`, if the inputs cannot be fingerprinted).
+        :return: `set` of names of the tables which must be rebuilt.
+        """
+        self.fingerprints = fingerprints
+        manifest = self.snapshot_dir / 'manifest.json'
+        if self.incremental and manifest.exists():
+            previous = load(manifest)
+            self.reused = {
+                table: previous['extents'][table] for table, fp in fingerprints.items()
+                if fp and previous['fingerprints'].get(table) == fp}
+        return set(fingerprints) - set(self.reused)
+
+    def write(self, **kw):
+        with self.profile.stage('write') as stage:
+            for table, extent in self.reused.items():
+                shutil.copy(self.snapshot_dir / self.cldf[table].url.string, self.cldf_spec.dir)
+                self.cldf[table].common_props['dc:extent'] = extent
+            CLDFWriter.write(self, **kw)
+            # Rows may be generated while writing, so we count the rows written:
+            stage['rows'] = sum(self.cldf[t].common_props['dc:extent'] for t in self.objects)
+        if self.incremental:
+            self.write_snapshot()
+        self.profile.write(self.cldf_spec.dir.parent / 'makecldf.profile.json')
+
+    def write_snapshot(self):
+        manifest = self.snapshot_dir / 'manifest.json'
+        # Invalidate the snapshot while it is being updated:
+        if manifest.exists():
+            manifest.unlink()
+        self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+        extents = {}
+        for table, fp in self.fingerprints.items():
+            if fp and (table in self.reused or table in self.objects):
+                fname = self.cldf[table].url.string
+                if table not in self.reused:
+                    shutil.copy(self.cldf_spec.dir / fname, self.snapshot_dir / fname)
+                extents[table] = self.cldf[table].common_props['dc:extent']
+        dump(
+            {'fingerprints': {t: self.fingerprints[t] for t in extents}, 'extents': extents},
+            manifest,
+            indent=2)
+
+
+# Compact representation of a row of the ValueTable.
+Value = collections.namedtuple(
+    'Value',
+    ['ID', 'Language_ID', 'Parameter_ID', 'Value', 'Code_ID', 'Comment', 'Source'],
+    defaults=[None])
+
+
+def bucket_by_code(values, cid_order):
+    """
+    Order values by code with a counting sort: Values are put into one bucket per code, keeping
+    their relative order, and values without code come first.
+
+    :param values: iterable of `Value` objects.
+    :param cid_order: `dict` mapping Code_IDs to their (1-based) position in the CodeTable.
+    :return: `list` of buckets, i.e. lists of `Value` objects.
+    """
+    buckets = [[] for _ in range(max(cid_order.values(), default=0) + 1)]
+    for value in values:
+        buckets[cid_order[value.Code_ID] if value.Code_ID else 0].append(value)
+    return buckets
+
+
 class Dataset(BaseDataset):
     dir = pathlib.Path(__file__).parent
     id = "barlowhandandfive"
 
+    @property
+    def cache_dir(self):
+        return self.dir / '.cache'
+
+    def glottolog_version(self, args):
+        """
+        :return: The `git describe` output of the Glottolog repository, or `None` for uncommitted \
+        changes in the Glottolog checkout.
+        """
+        try:
+            return None if args.glottolog.is_dirty() else args.glottolog.describe()
+        except ValueError:  # Not a git repository.
+            return None
+
+    def glottolog_languoids(self, args):
+        """
+        Read the Austronesian part of the Glottolog tree from a snapshot cached in `.cache/`.
+
+        The snapshot is keyed by the `git describe` output of the Glottolog repository, i.e. it is
+        recreated whenever a different Glottolog version is checked out. For uncommitted changes in
+        the Glottolog checkout, the tree is always walked and no snapshot is written.
+
+        :return: see `austronesian_languoids`.
+        """
+        version = self.glottolog_version(args)
+        if version is None:
+            return austronesian_languoids(args.glottolog.api)
+
+        # The name of the snapshot changes with the format of the data, e.g. ordered lineages.
+        snapshot = self.cache_dir / 'glottolog-aust1307-v2.pickle'
+        cached = read_snapshot(snapshot)
+        if cached and cached[0] == version:
+            return cached[1]
+        res = austronesian_languoids(args.glottolog.api)
+        write_snapshot(snapshot, version, res)
+        args.log.info('Wrote Glottolog snapshot for {} to {}'.format(version, snapshot))
+        return res
+
     def cldf_specs(self):  # A dataset must declare all CLDF sets it creates.
-        return CLDFSpec(module='StructureDataset', dir=self.cldf_dir)
+        return CLDFSpec(
+            module='StructureDataset', dir=self.cldf_dir, writer_cls=Writer)
+
+    def iterrows(self, name, columns=None):
+        """
+        Read the rows of a raw TSV file lazily - rather than via `self.raw_dir.read_csv`, which
+        returns a list.
+
+        :param columns: Optional list of names of the columns to read. Only these columns are \
+        then turned into rows, with their - often repetitive - values interned.
+        :return: generator of `dict`s or - if `columns` are specified - of `namedtuple`s with \
+        the columns as fields.
+        """
+        fname = self.raw_dir / '{}.tsv'.format(name)
+        if columns is None:
+            for row in reader(fname, delimiter='\t', dicts=True):
+                yield {k: (v or '').strip() for k, v in row.items()}
+            return
+
+        record = record_type(tuple(columns))
+        with fname.open(encoding='utf-8-sig', newline='') as f:
+            rows = csv.reader(f, delimiter='\t')
+            header = next(rows)
+            indices = [header.index(col) for col in columns]
+            width = max(indices) + 1
+            for row in rows:
+                if not row:
+                    continue
+                if len(row) < width:
+                    row.extend([''] * (width - len(row)))
+                yield record._make([sys.intern(row[i].strip()) for i in indices])
+
+    def cached(self, name, checksum, factory):
+        """
+        Read an object from a snapshot cached in `.cache/` - or create it and write the snapshot.
+
+        :param name: Filename of the snapshot.
+        :param checksum: Checksum of the inputs of the object. A snapshot with a different checksum \
+        is recreated.
+        :param factory: Callable creating the object.
+        """
+        snapshot = self.cache_dir / name
+        cached = read_snapshot(snapshot)
+        if cached and cached[0] == checksum:
+            return cached[1]
+        res = factory()
+        write_snapshot(snapshot, checksum, res)
+        return res
+
+    def form_index(self):
+        """
+        Read the `FormIndex` from a snapshot cached in `.cache/`, keyed by the checksum of the
+        forms TSV.
+        """
+        fname = 'Forms_of_hand_and_five_in_Austronesian_languages'
+        return self.cached(
+            'forms.pickle',
+            md5(self.raw_dir / '{}.tsv'.format(fname)),
+            lambda: FormIndex(self.iterrows(fname, columns=FORM_COLUMNS)))
+
+    def papuan_provinces(self):
+        """
+        :return: `list` of the geometries of the "Papuan" provinces of ID.
+        """
+        from shapely.geometry import shape
+
+        return [
+            shape(f['geometry']) for f in
+            load(self.raw_dir / 'idn_papuan_provinces.geojson')['features']]
+
+    def in_papuan_provinces(self, coords, buffer=0.2, provinces=None):
+        """
+        Classify points as being located in (or close to) one of the "Papuan" provinces of ID.
+
+        All points are classified in one vectorized query against a spatial index of the province
+        polygons.
+
+        :param coords: `dict` mapping Glottocodes to `(longitude, latitude)` pairs.
+        :param buffer: Points within this distance (in degrees) of a province count as inside.
+        :param provinces: The `papuan_provinces`, if already loaded.
+        :return: `dict` mapping the Glottocodes to `bool`.
+        """
+        import shapely
+
+        if not coords:
+            return {}
+        tree = shapely.STRtree(self.papuan_provinces() if provinces is None else provinces)
+        gcs = list(coords)
+        hits = set(tree.query(
+            shapely.points([coords[gc] for gc in gcs]),
+            predicate='dwithin',
+            distance=buffer)[0])
+        return {gc: i in hits for i, gc in enumerate(gcs)}
+
+    def fingerprints(self, args):
+        """
+        Compute fingerprints of the inputs of the tables listed in `DEPENDENCIES`. Since the
+        fingerprints also cover this module, any change to the code forces a full rebuild.
+
+        :return: `dict` mapping table names to fingerprints, or to `None` if the table depends on \
+        a Glottolog checkout with uncommitted changes.
+        """
+        inputs = {
+            'glottolog': self.glottolog_version(args),
+            'PARAMETERS': checksum(list(PARAMETERS.items())),
+        }
+        res = {}
+        for table, deps in DEPENDENCIES.items():
+            for dep in deps:
+                if dep not in inputs:
+                    inputs[dep] = md5(self.raw_dir / dep)
+            fps = [inputs[dep] for dep in deps]
+            res[table] = None if None in fps else checksum(md5(pathlib.Path(__file__)), fps)
+        return res
+
+    def prefetch(self, args, rebuild):
+        """
+        Start loading the inputs needed to rebuild the given tables concurrently in a thread pool.
+        In particular for cold caches on slow filesystems, this allows reading the raw data while
+        the Glottolog tree - i.e. thousands of small files - is walked.
+
+        :param rebuild: `set` of names of the tables to rebuild.
+        :return: `dict` mapping names of inputs to `concurrent.futures.Future`s of the loaded data.
+        """
+        profile = args.writer.profile
+
+        def glottolog():
+            with profile.stage('glottolog') as stage:
+                res = self.glottolog_languoids(args)
+                stage['rows'] = len(res[2])
+            return res
+
+        def values():
+            with profile.stage('values.csv') as stage:
+                what_replaced = {'hand': {}, 'five': {}}
+                for stage['rows'], row in enumerate(
+                        self.raw_dir.read_csv('values.csv', dicts=True), start=1):
+                    if row['Parameter_ID'].startswith('Source_of_'):
+                        what_replaced[row['Parameter_ID'].partition('_of_')[-1][1:-1]][row['Language_ID']] = row['Value']
+            return what_replaced
+
+        def num_syst():
+            with profile.stage('num_syst.csv') as stage:
+                res = self.raw_dir.read_csv('num_syst.csv', dicts=True)
+                stage['rows'] = len(res)
+            return res
+
+        def colex():
+            with profile.stage('Colexification_of_hand_and_five_in_Austronesian_languages.tsv') as stage:
+                res = [
+                    {k: None if v == '_' else v for k, v in row.items()} for row in
+                    self.iterrows('Colexification_of_hand_and_five_in_Austronesian_languages')]
+                stage['rows'] = len(res)
+            return res
+
+        def provinces():
+            with profile.stage('idn_papuan_provinces.geojson') as stage:
+                res = self.papuan_provinces()
+                stage['rows'] = len(res)
+            return res
+
+        def forms():
+            with profile.stage('Forms_of_hand_and_five_in_Austronesian_languages.tsv'):
+                return self.form_index()
+
+        def replacements():
+            res = {}
+            for concept in ['five', 'hand']:
+                name = 'Replacements_of_{}_in_Austronesian'.format(concept)
+                with profile.stage('{}.tsv'.format(name)) as stage:
+                    res[concept] = list(self.iterrows(name))
+                    stage['rows'] = len(res[concept])
+            return res
+
+        jobs = {}
+        if rebuild & {'LanguageTable', 'FormTable', 'replacements.csv'}:
+            jobs['glottolog'] = glottolog
+        if 'ValueTable' in rebuild:
+            jobs.update(values=values, num_syst=num_syst)
+        if rebuild & {'LanguageTable', 'FormTable', 'ValueTable'}:
+            jobs['colex'] = colex
+        if 'LanguageTable' in rebuild:
+            jobs['provinces'] = provinces
+        if 'FormTable' in rebuild:
+            jobs['forms'] = forms
+        if 'replacements.csv' in rebuild:
+            jobs['replacements'] = replacements
+
+        pool = futures.ThreadPoolExecutor(max_workers=max(len(jobs), 1))
+        res = {name: pool.submit(job) for name, job in jobs.items()}
+        # Submitted jobs are still run, but the threads are released as soon as they are done.
+        pool.shutdown(wait=False)
+        return res
+
+    def iter_languages(self, colex, gl_langs, melanesia):
+        for row in colex:
+            yield dict(
+                ID=row['Glottocode'],
+                Glottocode=row['Glottocode'],
+                Name=row['Language_name'],
+                Latitude=gl_langs[row['Glottocode']].latitude,
+                Longitude=gl_langs[row['Glottocode']].longitude,
+                Number=int(row['Language_number']),
+                Melanesia='yes' if melanesia[row['Glottocode']] else 'no',
+            )
+
+    def iter_forms(self, colex, provenance):
+        for row in colex:
+            for col in ['five', 'hand']:
+                if row[col]:
+                    ds_gc, ds_name = provenance[row['Glottocode'], col]
+                    yield dict(
+                        ID='{}-{}'.format(row['Glottocode'], col),
+                        Language_ID=row['Glottocode'],
+                        Parameter_ID=col,
+                        Value=row[col],
+                        Form=row[col],
+                        Contribution_ID=row['Dataset_for_' + col],
+                        Source=[row['Dataset_for_' + col]],
+                        Glottocode_in_dataset=ds_gc,
+                        Language_name_in_dataset=ds_name,
+                    )
+
+    def iter_values(self, colex, what_replaced):
+        """
+        Code the values of the parameters described in the colexification data.
+
+        :return: generator of `Value` objects.
+        """
+        for row in colex:
+            for (pid, pname, _), codes in PARAMETERS.items():
+                val = row.get(pname.replace(' ', '_').replace('‘', '').replace('’', ''))
+                if val:
+                    if val == '(recolexification)':
+                        cid = None
+                    elif pid.endswith('_replacement'):
+                        cid = '{}-{}'.format(pid, slug(what_replaced[pid.split('_')[0]][row['Glottocode']]))
+                    elif codes:
+                        cid = '{}-{}'.format(pid, slug(val))
+                    else:
+                        cid = None
+
+                    if pid.endswith('replacement') and val == '?':
+                        val = 'unclear'
+                    yield Value(
+                        ID='{}-{}'.format(pid, row['Glottocode']),
+                        Language_ID=row['Glottocode'],
+                        Parameter_ID=pid,
+                        Value=None if val == '(recolexification)' else val,
+                        Code_ID=cid,
+                        Comment=val if val == '(recolexification)' else None,
+                    )
 
-    def iterrows(self, name):
-        for row in self.raw_dir.read_csv('{}.tsv'.format(name), delimiter='\t', dicts=True):
-            yield {k: (v or '').strip() for k, v in row.items()}
+            if row['hand'] and row['hand'] == row['five']:
+                assert row['Is_there_colexification?'] == 'full colexification', row
+            elif row['hand'] and row['five'] and (row['hand'] in row['five'] or row['five'] in row['hand']):
+                if row['Is_there_colexification?'] not in {'full colexification', 'partial colexification'}:
+                    assert (row['five'].startswith('lim')) and (row['hand'].startswith('im'))
+
+    def iter_replacements(self, replacements, gl_langs, members):
+        """
+        :param replacements: `dict` mapping concepts to the rows of their replacements TSV.
+        """
+        for concept in ['five', 'hand']:
+            for row in replacements[concept]:
+                row['Subgroup'] = {
+                    'East Choiseul3': 'East Choiseul',
+                    'Mainland New Caledonia':  'Mainland New Caledonian',
+                }.get(row['Subgroup'], row['Subgroup'])
+                gl = gl_langs[row['Subgroup']]
+                yield dict(
+                    ID='{}-{}'.format(concept, row['Higher_count']),
+                    Concept=concept,
+                    Replacement_Group='{}-{}'.format(concept, row['Lower_count'][:-1]),
+                    Subgroup=row['Subgroup'],
+                    Comment=row['Comment'],
+                    Source=row['Sources_of_‘{}’'.format(concept)],
+                    Language_IDs=members.get(gl.id, []),
+                )
 
     def cmd_readme(self, args):
         return add_markdown_text(
@@ -427,29 +1136,13 @@ class Dataset(BaseDataset):
 
         args.writer.cldf.add_sources(BARLOW_2023, ABVD, LEXIRUMAH, CHANNUMERALS, BARLOWPACIFIC)
 
-        gl_langs, lineages, gl_countries = {}, {}, {}
-        for lg in args.glottolog.api.languoids():
-            if lg.lineage and lg.lineage[0][1] == 'aust1307':
-                if lg.level == args.glottolog.api.languoid_levels.language:
-                    lineages[lg.id] = {gc for _, gc, _ in lg.lineage}
-                gl_countries[lg.id] = {c.id for c in lg.countries}
-                gl_langs[lg.id] = lg
-                if lg.id == 'amba1266':  # Amba (Solomon Islands)
-                    gl_langs['Amba'] = lg
-                gl_langs[lg.name] = lg
-
-        what_replaced = {'hand': {}, 'five': {}}
-        for row in self.raw_dir.read_csv('values.csv', dicts=True):
-            if row['Parameter_ID'].startswith('Source_of_'):
-                what_replaced[row['Parameter_ID'].partition('_of_')[-1][1:-1]][row['Language_ID']] = row['Value']
-
-        forms = collections.defaultdict(lambda: collections.defaultdict(set))
-        for row in self.iterrows('Forms_of_hand_and_five_in_Austronesian_languages'):
-            if (not row['Glottocode']) and row['Language_level_glottocode']:
-                row['Glottocode'] = row['Language_level_glottocode']
-            if row['Glottocode']:
-                assert row['Glottocode'] in gl_langs, row['Glottocode']
-                forms[row['Language_level_glottocode']][(row['Dataset'], row['Glottocode'], row['Language_name'])].add((row['Form'], row['Parameter_ID']))
+        profile = args.writer.profile
+        fingerprints = self.fingerprints(args)
+        rebuild = args.writer.rebuild(fingerprints)
+        for table in sorted(set(fingerprints) - rebuild):
+            args.log.info('Reusing {} from the last incremental build'.format(table))
+        # The inputs are loaded concurrently and only joined where first needed:
+        inputs = self.prefetch(args, rebuild)
 
         for cid, (name, citation) in CONTRIBUTIONS.items():
             args.writer.objects['ContributionTable'].append(
@@ -469,120 +1162,74 @@ class Dataset(BaseDataset):
                     color=color,
                 ))
 
-        papuan_provinces = [
-            shape(f['geometry']) for f in
-            load(self.raw_dir / 'idn_papuan_provinces.geojson')['features']]
-
-        for row in self.iterrows('Colexification_of_hand_and_five_in_Austronesian_languages'):
-            # Language_number	Glottocode	Language_name	Latitude	Longitude
-            # hand	five -> forms
-            row = {k: None if v == '_' else v for k, v in row.items()}
+        # Language_number	Glottocode	Language_name	Latitude	Longitude
+        # hand	five -> forms
+        if rebuild & {'LanguageTable', 'FormTable', 'ValueTable'}:
+            colex = inputs['colex'].result()
+        if rebuild & {'LanguageTable', 'FormTable', 'replacements.csv'}:
+            gl_langs, lineages, gl_countries = inputs['glottolog'].result()
 
+        # Rows are generated lazily and written as they are produced, except for values, which
+        # are collected in compact form, to be written ordered by code.
+        if 'LanguageTable' in rebuild:
             # Compute whether a language is classified as in Melanesia or not:
-            countries = gl_countries[row['Glottocode']]
-            if row['Glottocode'] == 'tons1239':
-                # Glottolog 5.0 erroneously lists Tonsawang as spoken also in the Solomons.
-                countries.remove('SB')
-            if row['Glottocode'] == 'gilb1244':
-                # We ignore the small, relocated Gilbertese population in the Solomons.
-                countries.remove('SB')
-            # Languages spoken in PG, SB, VU or NC - but not in ID - are considered in Melanesia.
-            melanesian = bool(countries.intersection({'PG', 'SB', 'VU', 'NC'}))
-            if not melanesian:
+            with profile.stage('melanesia') as stage:
+                melanesia, coords = {}, {}
+                for row in colex:
+                    countries = gl_countries[row['Glottocode']]
+                    if row['Glottocode'] == 'tons1239':
+                        # Glottolog 5.0 erroneously lists Tonsawang as spoken also in the Solomons.
+                        countries.remove('SB')
+                    if row['Glottocode'] == 'gilb1244':
+                        # We ignore the small, relocated Gilbertese population in the Solomons.
+                        countries.remove('SB')
+                    # Languages spoken in PG, SB, VU or NC - but not in ID - are considered in Melanesia.
+                    melanesia[row['Glottocode']] = bool(countries.intersection({'PG', 'SB', 'VU', 'NC'}))
+                    if not melanesia[row['Glottocode']]:
+                        coords[row['Glottocode']] = (float(row['Longitude']), float(row['Latitude']))
                 # Languages from ID are considered in Melanesia, if they are spoken in the "Papuan"
                 # provinces.
-                p = Point(float(row['Longitude']), float(row['Latitude']))
-                melanesian = (any(pp.contains(p) for pp in papuan_provinces)
-                              or min(distance(p, pp) for pp in papuan_provinces) < 0.2)
-
-            args.writer.objects['LanguageTable'].append(dict(
-                ID=row['Glottocode'],
-                Glottocode=row['Glottocode'],
-                Name=row['Language_name'],
-                Latitude=gl_langs[row['Glottocode']].latitude,
-                Longitude=gl_langs[row['Glottocode']].longitude,
-                Number=int(row['Language_number']),
-                Melanesia='yes' if melanesian else 'no',
-            ))
-
-            for col in ['five', 'hand']:
-                form = row[col]
-                if form:
-                    datasets = {}
-                    for k, v in forms[row['Glottocode']].items():
-                        if form in {f for f, c in v if c == col}:
-                            datasets[k[0]] = (k[1], k[2])
-                    assert row['Dataset_for_{}'.format(col)] in datasets
-                    ds_gc, ds_name = datasets[row['Dataset_for_{}'.format(col)]]
-                    args.writer.objects['FormTable'].append(dict(
-                        ID='{}-{}'.format(row['Glottocode'], col),
-                        Language_ID=row['Glottocode'],
-                        Parameter_ID=col,
-                        Value=row[col],
-                        Form=row[col],
-                        Contribution_ID=row['Dataset_for_' + col],
-                        Source=[row['Dataset_for_' + col]],
-                        Glottocode_in_dataset=ds_gc,
-                        Language_name_in_dataset=ds_name,
-                    ))
-
-            for (pid, pname, _), codes in PARAMETERS.items():
-                val = row.get(pname.replace(' ', '_').replace('‘', '').replace('’', ''))
-                if val:
-                    if val == '(recolexification)':
-                        cid = None
-                    elif pid.endswith('_replacement'):
-                        cid = '{}-{}'.format(pid, slug(what_replaced[pid.split('_')[0]][row['Glottocode']]))
-                    elif codes:
-                        cid = '{}-{}'.format(pid, slug(val))
-                    else:
-                        cid = None
-
-                    if pid.endswith('replacement') and val == '?':
-                        val = 'unclear'
-                    args.writer.objects['ValueTable'].append(dict(
-                        ID='{}-{}'.format(pid, row['Glottocode']),
-                        Language_ID=row['Glottocode'],
-                        Parameter_ID=pid,
-                        Value=None if val == '(recolexification)' else val,
-                        Code_ID=cid,
-                        Comment=val if val == '(recolexification)' else None,
-                    ))
+                melanesia.update(
+                    self.in_papuan_provinces(coords, provinces=inputs['provinces'].result()))
+                stage['rows'] = len(melanesia)
+            args.writer.objects['LanguageTable'] = self.iter_languages(colex, gl_langs, melanesia)
 
-            if row['hand'] and row['hand'] == row['five']:
-                assert row['Is_there_colexification?'] == 'full colexification', row
-            elif row['hand'] and row['five'] and (row['hand'] in row['five'] or row['five'] in row['hand']):
-                if row['Is_there_colexification?'] not in {'full colexification', 'partial colexification'}:
-                    assert (row['five'].startswith('lim')) and (row['hand'].startswith('im'))
+        if 'FormTable' in rebuild:
+            with profile.stage('provenance'):
+                forms = inputs.pop('forms').result()
+                for gc in sorted(forms.glottocodes):
+                    assert gc in gl_langs, gc
+                # We only keep the provenance of the forms selected for the FormTable:
+                provenance = {}
+                for row in colex:
+                    for col in ['five', 'hand']:
+                        if row[col]:
+                            datasets = {
+                                prov.dataset: (prov.glottocode, prov.language_name)
+                                for prov in forms.provenance(row['Glottocode'], col, row[col])}
+                            assert row['Dataset_for_{}'.format(col)] in datasets
+                            provenance[row['Glottocode'], col] = datasets[row['Dataset_for_{}'.format(col)]]
+                del forms
+            args.writer.objects['FormTable'] = self.iter_forms(colex, provenance)
 
-        for row in self.raw_dir.read_csv('num_syst.csv', dicts=True):
-            args.writer.objects['ValueTable'].append(dict(
-                ID='num_syst-{}'.format(row['Language_ID']),
-                Language_ID=row['Language_ID'],
-                Parameter_ID='num_syst',
-                Value=row['Value'],
-                Code_ID='num_syst-{}'.format(slug(row['Value'])),
-                Comment=row['Comment'] or None,
-                Source=['Barlow2023'],
-            ))
-
-        args.writer.objects['ValueTable'] = sorted(
-            args.writer.objects['ValueTable'],
-            key=lambda r: cid_order[r['Code_ID']] if r['Code_ID'] else 0)
+        if 'ValueTable' in rebuild:
+            with profile.stage('value_coding') as stage:
+                values = bucket_by_code(
+                    itertools.chain(
+                        self.iter_values(colex, inputs['values'].result()),
+                        (Value(
+                            ID='num_syst-{}'.format(row['Language_ID']),
+                            Language_ID=row['Language_ID'],
+                            Parameter_ID='num_syst',
+                            Value=row['Value'],
+                            Code_ID='num_syst-{}'.format(slug(row['Value'])),
+                            Comment=row['Comment'] or None,
+                            Source=['Barlow2023'],
+                        ) for row in inputs['num_syst'].result())),
+                    cid_order)
+                stage['rows'] = sum(len(bucket) for bucket in values)
+            args.writer.objects['ValueTable'] = (v._asdict() for bucket in values for v in bucket)
 
-        for concept in ['five', 'hand']:
-            for row in self.iterrows('Replacements_of_{}_in_Austronesian'.format(concept)):
-                row['Subgroup'] = {
-                    'East Choiseul3': 'East Choiseul',
-                    'Mainland New Caledonia':  'Mainland New Caledonian',
-                }.get(row['Subgroup'], row['Subgroup'])
-                gl = gl_langs[row['Subgroup']]
-                args.writer.objects['replacements.csv'].append(dict(
-                    ID='{}-{}'.format(concept, row['Higher_count']),
-                    Concept=concept,
-                    Replacement_Group='{}-{}'.format(concept, row['Lower_count'][:-1]),
-                    Subgroup=row['Subgroup'],
-                    Comment=row['Comment'],
-                    Source=row['Sources_of_‘{}’'.format(concept)],
-                    Language_IDs=sorted([k for k, v in lineages.items() if gl.id in v] if gl.id not in lineages else [gl.id]),
-                ))
+        if 'replacements.csv' in rebuild:
+            args.writer.objects['replacements.csv'] = self.iter_replacements(
+                inputs['replacements'].result(), gl_langs, subgroup_members(lineages))
@@ -17,12 +17,19 @@ setup(
     },
     install_requires=[
         'cldfbench',
-        'shapely',
+        'shapely>=2.0',
+        'numpy',
         'clldutils',
     ],
     extras_require={
         'test': [
             'pytest-cldf',
         ],
+        'benchmark': [
+            'pytest-benchmark',
+        ],
+        'parquet': [
+            'pyarrow',
+        ],
     },
 )